@@ -3,36 +3,38 @@
 CLI Application - Simple interface for the data collection agent
 Handles command line arguments, user input/output, and debug setup
 """
-#%%
-import nest_asyncio
-nest_asyncio.apply()
-
 #%%
 import os
 import asyncio
 import sys
 
+# Re-entrant event loop is only needed inside an interactive kernel (already running a loop)
+if "ipykernel" in sys.modules:
+    import nest_asyncio
+    nest_asyncio.apply()
+
 # Check for debug and test flags FIRST
 DEBUG_MODE = "--debug" in sys.argv
 TEST_MODE = "--test" in sys.argv
 CORE_AGENT_MODE = "--core-agent" in sys.argv
 
+# Output directories exist before the first turn - not only if the run reaches its end
+os.makedirs("data/sessions", exist_ok=True)
+
 # Import telemetry BEFORE any SK imports to capture everything
 from monitoring.telemetry import telemetry
 
-# Enable telemetry logging immediately if in debug mode
+# Enable telemetry logging immediately if in debug mode (creates data/telemetry and opens its log)
 if DEBUG_MODE:
     telemetry.enable_logging()
     print("📊 Telemetry logging enabled - capturing all SK operations")
 
 # Now import agent and UI functions
 from core.agent import Agent
-from core.turkish_persona_agent import TurkishPersonaAgent
+from core.tool_registry import close_openai_client
 from ui.chat_ui import (print_system_message, print_agent_message, print_user_message, 
                        print_welcome, get_user_input, print_thinking_indicator, 
                        clear_thinking_indicator)
-import json
-import re
 
 
 class ConversationHandler:
@@ -40,11 +42,20 @@ class ConversationHandler:
     
     def __init__(self, agent):
         self.agent = agent
-        self.turkish_agent = None  # Lazy load
+        self.turkish_agent = None  # Built in warmup() unless in core agent mode
         self._process_input = agent.process_user_input
         self._is_complete = agent.is_conversation_complete
         self._get_greeting = agent.handle_initial_greeting
     
+    async def warmup(self):
+        """Build the Turkish persona agent at startup so the first message doesn't pay for it"""
+        if CORE_AGENT_MODE or self.turkish_agent is not None:
+            return
+        # Imported here - core agent mode (and test.py, which imports this module) never needs it
+        from core.turkish_persona_agent import TurkishPersonaAgent
+        self.turkish_agent = TurkishPersonaAgent(self.agent.data_manager)
+        await self.turkish_agent.initialize()
+    
     async def _display_agent_message(self, english_response):
         """Route through Turkish agent or show raw response based on flags"""
         if not english_response or not english_response.strip():
@@ -55,32 +66,27 @@ class ConversationHandler:
             print_agent_message(english_response)
             return
         
-        # Lazy load Turkish agent
-        if self.turkish_agent is None:
-            self.turkish_agent = TurkishPersonaAgent()
-            await self.turkish_agent.initialize()
+        # Normally already built at startup - covers handlers that skipped warmup()
+        await self.warmup()
         
         # Get session context
         session = self.agent.get_session()
         
-        # Process with context and get multiple messages
-        turkish_messages = await self.turkish_agent.translate_to_persona(english_response, session)
-        
-        # Display each message separately (simulating WhatsApp conversation)
-        for message in turkish_messages:
+        # Stream messages - each one is displayed as soon as it is complete (simulating WhatsApp conversation)
+        async for message in self.turkish_agent.stream_to_persona(english_response, session):
             print_agent_message(message)
     
-    def _execute_widget(self, widget_info):
-        """Execute widget for real user interaction"""
+    async def _execute_widget(self, widget_info, test_value=None):
+        """Execute widget - real user interaction, or auto-selection of test_value (test runner)"""
         from ui.widget_handler import WidgetHandler
         widget_handler = WidgetHandler()
         
-        # Execute widget - real user interaction, no test automation
-        selected_value = widget_handler.show_widget_interface(widget_info["question_structure"])
+        selected_value = widget_handler.show_widget_interface(widget_info["question_structure"], test_value=test_value)
         
         if selected_value:
             # Auto-call update_data with selected value
-            update_result = self.agent.data_manager.update_data(widget_info["field"], selected_value)
+            async with self.agent.data_manager.buffered():
+                update_result = await self.agent.data_manager.update_data(widget_info["field"], selected_value)
             print(f"    ✅ WIDGET: Updated {widget_info['field']} = {selected_value}")
             
             # Store completion info for hidden LLM context injection
@@ -106,7 +112,7 @@ class ConversationHandler:
         if not widget_info:
             return turn_number
             
-        selected_value = self._execute_widget(widget_info)
+        selected_value = await self._execute_widget(widget_info)
         
         if not selected_value:
             return turn_number
@@ -165,7 +171,7 @@ class ConversationHandler:
                 widget_info = session.stage_manager.get_pending_widget()
                 if widget_info:
                     # Execute widget after LLM response is shown
-                    selected_value = self._execute_widget(widget_info)
+                    selected_value = await self._execute_widget(widget_info)
                     
                     if selected_value:
                         # Continue with next turn automatically using widget selection
@@ -219,16 +225,22 @@ async def main():
     
     # Initialize agent
     agent = Agent(debug_mode=DEBUG_MODE)
-    await agent.initialize()
     
-    # Start session
-    session = agent.start_session()
-    
-    # Create conversation handler
-    conversation_handler = ConversationHandler(agent)
-    
-    # Run conversation
-    await conversation_handler.run_conversation()
+    try:
+        await agent.initialize()
+        
+        # Start session
+        session = agent.start_session()
+        
+        # Create conversation handler and warm up persona agent before the greeting
+        conversation_handler = ConversationHandler(agent)
+        await conversation_handler.warmup()
+        
+        # Run conversation
+        await conversation_handler.run_conversation()
+    finally:
+        # Release pooled OpenAI connections - also on errors/interrupts
+        await close_openai_client()
     
     # Print final session flow
     session.print_session_flow()
@@ -238,31 +250,28 @@ async def main():
     session.update_session_end_state(final_data)
     
     # Save session for debugging
-    os.makedirs("data/sessions", exist_ok=True)
     session.save_to_file()
     print(f"\n💾 Session saved to: data/sessions/{session.id}.json")
     
     # Save telemetry if enabled
     if DEBUG_MODE:
-        os.makedirs("data/telemetry", exist_ok=True)
-        
-        # Print prompt evolution (as requested to keep)
-        print("\n🔄 PROMPT EVOLUTION")
-        print("=" * 60)
+        # Print prompt evolution (as requested to keep) - collected and written once
+        lines = ["\n🔄 PROMPT EVOLUTION", "=" * 60]
         
         prompt_events = [e for e in telemetry.get_events() if e['type'] in ['PROMPT_INITIAL', 'PROMPT_EVOLVED']]
         for i, event in enumerate(prompt_events):
             timestamp = event['timestamp'].split('T')[1][:8]
             if event['type'] == 'PROMPT_INITIAL':
-                print(f"\n{i+1}. [{timestamp}] INITIAL (hash: {event['data']['prompt_hash']})")
-                print(f"   Length: {event['data']['prompt_length'] if 'prompt_length' in event['data'] else len(event['data']['full_messages'])} chars")
+                lines.append(f"\n{i+1}. [{timestamp}] INITIAL (hash: {event['data']['prompt_hash']})")
+                lines.append(f"   Length: {event['data']['prompt_length'] if 'prompt_length' in event['data'] else len(event['data']['full_messages'])} chars")
                 # Show preview of initial prompt
                 preview = event['data']['user_content'][:200] + "..." if len(event['data']['user_content']) > 200 else event['data']['user_content']
-                print(f"   Preview: {preview}")
+                lines.append(f"   Preview: {preview}")
             else:
-                print(f"\n{i+1}. [{timestamp}] EVOLVED (hash: {event['data']['evolved_hash']})")
-                print(f"   Length: {len(event['data']['evolved_messages'])} chars")
-                print(f"   Changes: {event['data']['additions']}")
+                lines.append(f"\n{i+1}. [{timestamp}] EVOLVED (hash: {event['data']['evolved_hash']})")
+                lines.append(f"   Length: {len(event['data']['evolved_messages'])} chars")
+                lines.append(f"   Changes: {event['data']['additions']}")
+        print("\n".join(lines))
         
         # Save telemetry outputs
         telemetry.to_timestamped_log("data/telemetry/telemetry")
@@ -281,6 +290,7 @@ async def main():
 
 #%%
 if __name__ == "__main__":
+    # asyncio.run (not asyncio.Runner) - it is what nest_asyncio patches for the ipykernel cells
     asyncio.run(main())
 
 # %%
\ No newline at end of file
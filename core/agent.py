@@ -4,31 +4,60 @@ Agent - Core agent logic for conversation management
 Handles conversation flow, initial greetings, and agent reasoning
 """
 
-import hashlib
-import json
-from semantic_kernel.functions.kernel_arguments import KernelArguments
+import traceback
+import orjson
+from semantic_kernel.contents import ChatHistory, FunctionCallContent
+from semantic_kernel.contents.chat_message_content import ChatMessageContent
+from semantic_kernel.contents.utils.author_role import AuthorRole
 from memory.session_manager import Session
 from core.tool_registry import setup_kernel, get_available_functions
 from monitoring.telemetry import telemetry
 from prompts.prompt_manager import PromptManager
 from utils.dict_utils import dict_diff
+from utils.hash_utils import short_hash
+
+
+def _parse_call_arguments(function_call):
+    """Tool call arguments arrive as a JSON string or an already-parsed mapping"""
+    arguments = function_call.arguments
+    if not isinstance(arguments, str):
+        return dict(arguments or {})
+    try:
+        return orjson.loads(arguments)
+    except orjson.JSONDecodeError:
+        return {}
+
+
+def _raw_response(response):
+    """Compact JSON of the response messages - skips the provider's inner_content object tree"""
+    return orjson.dumps(
+        [message.model_dump(exclude={'inner_content'}) for message in response],
+        default=str,
+        option=orjson.OPT_NON_STR_KEYS
+    ).decode()
 
 
 class Agent:
     """Core agent that handles conversation flow and reasoning"""
     
-    def __init__(self, debug_mode=False):
+    def __init__(self, debug_mode=False, data_file="data/data.json"):
         self.debug_mode = debug_mode
+        self.data_file = data_file
         self.kernel = None
         self.data_manager = None
         self.settings = None
+        self.chat_service = None
+        self.available_functions = []
         self.prompt_manager = PromptManager()
         self.session = None
         
     async def initialize(self):
         """Initialize the agent with kernel and components"""
         # Setup kernel and components
-        self.kernel, self.data_manager, self.settings = setup_kernel(debug_mode=self.debug_mode)
+        self.kernel, self.data_manager, self.settings = setup_kernel(debug_mode=self.debug_mode, data_file=self.data_file)
+        self.chat_service = self.kernel.get_service("openai")
+        # Plugins are registered once in setup_kernel - the list never changes between turns
+        self.available_functions = get_available_functions(self.kernel)
         
         # Prompt manager is already initialized in constructor
         if self.debug_mode:
@@ -39,7 +68,7 @@ class Agent:
         """Start a new conversation session"""
         self.session = Session()
         # Set session start state
-        self.session.session_start_state = self.data_manager.load_data().copy()
+        self.session.session_start_state = self.data_manager.snapshot()
         if self.debug_mode:
             print(f"📝 Started session: {self.session.id}")
         return self.session
@@ -68,7 +97,8 @@ class Agent:
         
         # Reload data to get latest state
         data = self.data_manager.load_data()
-        current_status = self.data_manager.get_data_status_with_insights()
+        snapshot = self.data_manager.snapshot()  # Start-of-turn state, shared until data changes
+        current_status = self.data_manager.get_data_status_with_insights(data)
         
         # Get updated conversation history
         conversation_history = self.session.get_conversation_history()
@@ -79,39 +109,41 @@ class Agent:
         if widget_completion:
             hidden_context = f"\n\nCRITICAL: DO NOT call update_data for {widget_completion['field']} - it was already updated via widget to {widget_completion['selected_value']}. Result: {widget_completion['update_result']}. Just acknowledge the selection and continue to the next missing field."
         
-        # Build prompt with current state using Prompt Manager
-        prompt = self.prompt_manager.build_conversation_prompt(
+        # Build per-turn prompt with current state using Prompt Manager - rendered once with the actual input
+        turn_prompt = self.prompt_manager.build_turn_prompt(
             conversation_history=conversation_history,
             current_status=current_status,
-            user_input_placeholder="{{$user_input}}"
+            user_input=user_input
         )
         
         # Inject hidden widget context if available
         if hidden_context:
-            prompt = prompt + hidden_context
+            turn_prompt = turn_prompt + hidden_context
+        
+        # Full text is system prefix + turn prompt - the session keeps the two parts and
+        # joins them only when inspected/saved; telemetry needs the joined text
+        system_prompt = self.prompt_manager.get_system_prompt()
+        prompt_parts = self.prompt_manager.prompt_parts(turn_prompt)
         
         if self.debug_mode:
+            prompt = self.prompt_manager.with_system_prompt(turn_prompt)
             # Track prompt in telemetry (initial or evolved)
-            system_prompt = self.prompt_manager.get_system_prompt()
             if turn_number == 0:
-                telemetry.prompt_initial(prompt, hashlib.md5(prompt.encode()).hexdigest()[:8])
+                telemetry.prompt_initial(prompt, short_hash(prompt))
             else:
                 telemetry.prompt_evolved(
-                    original_hash=hashlib.md5(system_prompt.encode()).hexdigest()[:8],
+                    original_hash=self.prompt_manager.get_system_prompt_hash(),
                     evolved_messages=prompt,
                     additions=f"conversation_turn_{turn_number+1}",
                     message_count=turn_number+1
                 )
         
-        # Get available functions for context
-        available_functions = get_available_functions(self.kernel)
-        
         # Start AI block with full context
         block_id = self.session.start_ai_block(
             user_input=user_input,
-            full_prompt=prompt.replace("{{$user_input}}", user_input),
-            functions_available=available_functions,
-            data_snapshot=data.copy()
+            prompt_parts=prompt_parts,
+            functions_available=self.available_functions,
+            data_snapshot=snapshot
         )
         
         # Update data manager with current block
@@ -119,30 +151,30 @@ class Agent:
         self.data_manager.current_block_id = block_id
         
         # Use direct chat completion instead of competing functions
-        from semantic_kernel.contents import ChatHistory
-        from semantic_kernel.contents.chat_message_content import ChatMessageContent
-        from semantic_kernel.contents.utils.author_role import AuthorRole
-        
-        # Create chat history with the prompt
+        # System prompt is its own byte-identical message every turn so the provider's
+        # prefix cache can hit; everything that changes goes in the user message after it
         chat_history = ChatHistory()
+        chat_history.add_message(ChatMessageContent(
+            role=AuthorRole.SYSTEM,
+            content=system_prompt
+        ))
         chat_history.add_message(ChatMessageContent(
             role=AuthorRole.USER,
-            content=prompt.replace("{{$user_input}}", user_input)
+            content=turn_prompt
         ))
         
-        # Get chat completion service and invoke with settings that include function calling
-        chat_service = self.kernel.get_service("openai")
-        
+        # Invoke chat service (resolved once in initialize) with settings that include function calling
+        # Tool-call updates are persisted in a single write when the call ends - also when it fails
         try:
-            response = await chat_service.get_chat_message_contents(
-                chat_history=chat_history,
-                settings=self.settings,  # This contains FunctionChoiceBehavior.Auto() for auto function calling
-                kernel=self.kernel
-            )
+            async with self.data_manager.buffered():
+                response = await self.chat_service.get_chat_message_contents(
+                    chat_history=chat_history,
+                    settings=self.settings,  # This contains FunctionChoiceBehavior.Auto() for auto function calling
+                    kernel=self.kernel
+                )
         except Exception as e:
             error_msg = f"❌ Chat Service Error: {e}"
             if self.debug_mode:
-                import traceback
                 traceback.print_exc()
             return error_msg
         
@@ -151,59 +183,53 @@ class Agent:
         clean_response = chat_message.content if chat_message else "No response received"
         
         # Complete the AI block
-        self.session.complete_ai_block(block_id, str(response), clean_response)
+        await self.session.complete_ai_block(block_id, _raw_response(response), clean_response)
         
         # Track what changed during this block and add to last block
         final_data = self.data_manager.load_data()
-        block_start_state = self.session.blocks[-1]['context']['data_state_snapshot']
+        block_start_state = self.session.blocks[-1].context['data_state_snapshot']
         changes = dict_diff(block_start_state, final_data)
-        self.session.blocks[-1]['response']['data_changes'] = changes
+        self.session.blocks[-1].response['data_changes'] = changes
         
         # STAGE 1: Track LLM requests (vs Stage 2 actual execution in kernel_functions)
         # Purpose: Debug LLM behavior, routing issues, compare request vs execution
-        if response:
-            messages = response if isinstance(response, list) else [response] if response else []
-            for message in messages:
-                if hasattr(message, 'items'):
-                    for item in message.items:
-                        if hasattr(item, 'function_call_result'):
-                            result = item.function_call_result
-                            
-                            # Extract arguments if available
-                            args = {}
-                            if hasattr(item, 'function_call') and hasattr(item.function_call, 'arguments'):
-                                try:
-                                    args = json.loads(item.function_call.arguments)
-                                except:
-                                    pass
-                            
-                            # Add to session block (STAGE 1: LLM request tracking)
-                            self.session.add_action_to_block(
-                                block_id,
-                                result.function_name,
-                                args,
-                                result.result
-                            )
-        
-        # Process response in telemetry if debug mode
+        # SK appends the model's tool-call messages to chat_history during auto invocation;
+        # results are recorded once, by Stage 2, in the block's 'actions'
+        for message in chat_history.messages:
+            for item in message.items:
+                if isinstance(item, FunctionCallContent):
+                    self.session.add_requested_action(
+                        block_id,
+                        item.function_name,
+                        _parse_call_arguments(item)
+                    )
+        
+        # Process response in telemetry if debug mode - inline: telemetry parents come from its
+        # global event stack, which the persona's conversation may push onto right after this returns
         if self.debug_mode:
-            telemetry.process_kernel_response(response, user_input, {
-                "model": "gpt-4o-mini",
-                "conversation_turn": turn_number + 1,
-                "data_state": data.copy(),
-                "prompt_length": len(prompt)
-            })
-            
-            # Extract token usage from metadata and add to session
-            usage = chat_message.metadata.get('usage')
-            if usage:
-                self.session.add_token_usage(block_id, usage.prompt_tokens, usage.completion_tokens)
-            
-            # End conversation in telemetry
-            telemetry.conversation_end(f"turn_{turn_number+1}", clean_response)
+            self._record_turn_telemetry(
+                response, chat_message, clean_response, user_input, block_id, turn_number, {
+                    "model": "gpt-4o-mini",
+                    "conversation_turn": turn_number + 1,
+                    "data_state": self.data_manager.snapshot(),
+                    "prompt_length": len(prompt_parts[0]) + len(prompt_parts[1])
+                }
+            )
         
         return clean_response
     
+    def _record_turn_telemetry(self, response, chat_message, clean_response, user_input, block_id, turn_number, context):
+        """Debug bookkeeping for a finished turn - in-memory appends, closes the turn's telemetry conversation"""
+        telemetry.process_kernel_response(response, user_input, context)
+        
+        # Extract token usage from metadata and add to session
+        usage = chat_message.metadata.get('usage') if chat_message else None
+        if usage:
+            self.session.add_token_usage(block_id, usage.prompt_tokens, usage.completion_tokens)
+        
+        # End conversation in telemetry
+        telemetry.conversation_end(f"turn_{turn_number+1}", clean_response)
+    
     def is_conversation_complete(self):
         """Check if conversation is complete (all data collected)"""
         data = self.data_manager.load_data()
@@ -5,7 +5,8 @@ Simple, clean setup for kernel initialization
 """
 
 import os
-import sys
+import httpx
+from openai import AsyncOpenAI
 import semantic_kernel as sk
 from semantic_kernel.connectors.ai.function_choice_behavior import FunctionChoiceBehavior
 from semantic_kernel.connectors.ai.open_ai import OpenAIChatPromptExecutionSettings
@@ -19,21 +20,60 @@ from monitoring.telemetry import telemetry
 # Load environment
 load_dotenv()
 
-def get_all_kernel_functions():
+# One pooled client shared by every chat service - keeps TCP/TLS connections alive across turns
+_openai_client = None
+# Core chat service is stateless, so every kernel (one per agent / test scenario) shares it
+_chat_service = None
+
+def get_openai_client(api_key):
+    """Get the process-wide AsyncOpenAI client, creating it on first use"""
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = AsyncOpenAI(
+            api_key=api_key,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+                timeout=httpx.Timeout(60.0)
+            )
+        )
+    return _openai_client
+
+def get_chat_service(api_key):
+    """Get the process-wide core chat service, creating it on first use"""
+    global _chat_service
+    if _chat_service is None:
+        _chat_service = OpenAIChatCompletion(
+            ai_model_id="gpt-4o-mini",
+            api_key=api_key,
+            service_id="openai",
+            async_client=get_openai_client(api_key)
+        )
+    return _chat_service
+
+async def close_openai_client():
+    """Close the shared client's connection pool (call once at shutdown)"""
+    global _openai_client, _chat_service
+    if _openai_client is not None:
+        await _openai_client.close()
+        _openai_client = None
+        _chat_service = None  # Holds the closed client
+
+def get_all_kernel_functions(data_file="data/data.json"):
     """Get all kernel functions from all tools for registration"""
     return {
-        'data_operations': DataManager(),
+        'data_operations': DataManager(data_file=data_file),
         # future tools can be added here:
         # 'api_operations': APIManager(),
         # 'email_operations': EmailManager(),
     }
 
-def setup_kernel(debug_mode=False):
+def setup_kernel(debug_mode=False, data_file="data/data.json"):
     """
     Setup and configure Semantic Kernel with all necessary components
     
     Args:
         debug_mode (bool): Whether to enable debug logging (should already be enabled if needed)
+        data_file (str): User data file the data_operations plugin reads and writes
         
     Returns:
         tuple: (kernel, data_manager, settings)
@@ -50,16 +90,11 @@ def setup_kernel(debug_mode=False):
     # Create kernel
     kernel = sk.Kernel()
     
-    # Add OpenAI service
-    chat_service = OpenAIChatCompletion(
-        ai_model_id="gpt-4o-mini",
-        api_key=api_key,
-        service_id="openai"
-    )
-    kernel.add_service(chat_service)
+    # Add shared OpenAI service
+    kernel.add_service(get_chat_service(api_key))
     
     # Register all tools
-    all_tools = get_all_kernel_functions()
+    all_tools = get_all_kernel_functions(data_file)
     data_manager = None
     
     for tool_name, tool_instance in all_tools.items():
@@ -4,9 +4,18 @@ Turkish Persona Agent - Context-aware empathetic Turkish communication
 Processes conversation context and provides natural, multi-message responses
 """
 
+import logging
+import os
+import re
 import sys
 from semantic_kernel import Kernel
-from semantic_kernel.connectors.ai.open_ai import OpenAIChatCompletion
+from semantic_kernel.connectors.ai.open_ai import OpenAIChatCompletion, OpenAIChatPromptExecutionSettings
+from semantic_kernel.contents import ChatHistory
+from core.tool_registry import get_openai_client
+from utils.debug_logger import get_debug_logger
+from utils.file_loader import load_text
+from utils.template_engine import replace_placeholders
+from utils.xml_parser import extract_xml_tags, CHATBOX_PATTERNS
 
 # Check for debug mode
 DEBUG_MODE = "--debug" in sys.argv
@@ -20,12 +29,19 @@ if DEBUG_MODE:
     except ImportError:
         pass
 
+log = get_debug_logger("turkish_agent")
+
+# Primary ChatBox pattern - used to detect completed messages while streaming
+_CHATBOX_RE = re.compile(CHATBOX_PATTERNS[0], re.DOTALL | re.IGNORECASE)
+
 class TurkishPersonaAgent:
     """Context-aware Turkish persona with empathy and natural conversation flow"""
     
-    def __init__(self):
+    def __init__(self, data_manager):
+        self.data_manager = data_manager  # Shared with core agent - same in-memory data
         self.kernel = None
         self.chat_service = None
+        self.settings = None
         self.prompt_template = None
         
     async def initialize(self):
@@ -33,25 +49,29 @@ class TurkishPersonaAgent:
         # Simple kernel setup
         self.kernel = Kernel()
         
-        # Add chat completion service
+        # Add chat completion service - on the shared pooled client, so persona calls
+        # reuse the core agent's open connections instead of handshaking on their own
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY not found in environment variables")
         self.chat_service = OpenAIChatCompletion(
             service_id="turkish_persona",
-            api_key=None,  # Uses OPENAI_API_KEY env var
-            ai_model_id="gpt-4o-mini"
+            api_key=api_key,
+            ai_model_id="gpt-4o-mini",
+            async_client=get_openai_client(api_key)
         )
         self.kernel.add_service(self.chat_service)
+        self.settings = OpenAIChatPromptExecutionSettings(service_id="turkish_persona")
         
         # Load prompt template
         self._load_prompt_template()
         
-        if DEBUG_MODE:
-            print("🇹🇷 Turkish Persona Agent initialized with context awareness")
+        log.debug("🇹🇷 Turkish Persona Agent initialized with context awareness")
     
     def _load_prompt_template(self):
         """Load Turkish persona prompt template"""
         try:
-            with open("prompts/templates/turkish_persona_prompt.txt", 'r', encoding='utf-8') as f:
-                self.prompt_template = f.read()
+            self.prompt_template = load_text("prompts/templates/turkish_persona_prompt.txt")
         except FileNotFoundError:
             raise RuntimeError("Turkish persona prompt template not found")
     
@@ -63,26 +83,26 @@ class TurkishPersonaAgent:
         conversation_lines = []
         
         for block in session.blocks:
-            if block['type'] == 'programmatic' and block['subtype'] == 'greeting':
+            if block.type == 'programmatic' and block.subtype == 'greeting':
                 # Skip greeting - it will be generated fresh by Turkish agent
                 continue
                 
-            elif block['type'] == 'ai_interaction':
+            elif block.type == 'ai_interaction':
                 # User input
-                user_input = block['user_input']
+                user_input = block.user_input
                 conversation_lines.append(f"Kullanıcı: {user_input}")
                 
                 # Check for successful data updates
                 successful_updates = []
-                for action in block['response']['actions']:
+                for action in block.response['actions']:
                     if action['function'] == 'update_data' and 'Updated' in action['result']:
                         field = action['arguments'].get('field')
                         value = action['arguments'].get('value')
                         successful_updates.append(f"{field}={value}")
                 
                 # AI response (will be replaced by Turkish version)
-                if block['response']['final_message']:
-                    english_response = block['response']['final_message']
+                if block.response['final_message']:
+                    english_response = block.response['final_message']
                     
                     # Add update context if any
                     if successful_updates:
@@ -99,8 +119,8 @@ class TurkishPersonaAgent:
         
         # Get the latest AI interaction block
         for block in reversed(session.blocks):
-            if block['type'] == 'ai_interaction':
-                actions = block['response']['actions']
+            if block.type == 'ai_interaction':
+                actions = block.response['actions']
                 if actions:
                     last_action = actions[-1]
                     if last_action['function'] == 'update_data':
@@ -155,79 +175,138 @@ class TurkishPersonaAgent:
     def _parse_xml_response(self, turkish_response):
         """Parse XML ChatBox responses into list of messages"""
         try:
-            from utils.xml_parser import extract_xml_tags, CHATBOX_PATTERNS
             return extract_xml_tags(turkish_response, CHATBOX_PATTERNS)
         except Exception as e:
-            if DEBUG_MODE:
-                print(f"⚠️ XML parsing failed: {e}")
+            log.debug("⚠️ XML parsing failed: %s", e)
             return [turkish_response.strip()]
     
-    async def process_with_context(self, english_response, session):
-        """Process English response with full conversation context"""
+    def _build_chat_history(self, english_response, session):
+        """Render the persona prompt with full conversation context into a chat history"""
+        # Build context
+        conversation_context = self._extract_conversation_context(session)
+        last_action_result = self._determine_last_action_result(session)
+        next_question = self._extract_next_question(english_response)
+        instruction_type = self._determine_instruction_type(english_response)
+        
+        # Get current data status using same format as core agent
+        current_data_status = self.data_manager.get_data_status()
         
-        # Validation
+        # Build prompt with all context
+        full_prompt = replace_placeholders(
+            self.prompt_template,
+            CONVERSATION_CONTEXT=conversation_context,
+            LAST_ACTION_RESULT=last_action_result,
+            NEXT_QUESTION=next_question,
+            INSTRUCTION_TYPE=instruction_type,
+            CURRENT_DATA_STATUS=current_data_status
+        )
+        
+        # Prompt is already fully rendered, so the chat service is called directly
+        # instead of building a prompt function every turn
+        chat_history = ChatHistory()
+        chat_history.add_user_message(full_prompt)
+        return chat_history
+    
+    def _start_processing(self, english_response):
+        """Validate input and log telemetry start - shared by streaming and non-streaming paths"""
         if not english_response or not english_response.strip():
             raise ValueError("Turkish agent requires non-empty English response")
         
-        # Log telemetry
         if TELEMETRY_AVAILABLE:
             telemetry.conversation_start("turkish_persona", english_response[:100])
+    
+    def _finish_processing(self, messages):
+        """Debug output and telemetry end for a completed persona response"""
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("🇹🇷 Generated %d messages: %s", len(messages), [msg[:20]+'...' for msg in messages])
+        
+        if TELEMETRY_AVAILABLE:
+            telemetry.conversation_end("turkish_persona", f"{len(messages)} messages generated")
+    
+    def _processing_failed(self, e):
+        """Log failure and build the RuntimeError raised to callers"""
+        if TELEMETRY_AVAILABLE:
+            telemetry.error("turkish_persona", str(e))
+        
+        error_msg = f"Turkish persona processing failed: {e}"
+        print(f"❌ {error_msg}")
+        return RuntimeError(error_msg)
+    
+    async def process_with_context(self, english_response, session):
+        """Process English response with full conversation context"""
+        self._start_processing(english_response)
         
         try:
-            # Build context
-            conversation_context = self._extract_conversation_context(session)
-            last_action_result = self._determine_last_action_result(session)
-            next_question = self._extract_next_question(english_response)
-            instruction_type = self._determine_instruction_type(english_response)
-            
-            # Get current data status using same format as core agent
-            from tools.data_manager import DataManager
-            data_manager = DataManager()
-            current_data_status = data_manager.get_data_status()
-            
-            # Build prompt with all context
-            full_prompt = self.prompt_template.replace("{{CONVERSATION_CONTEXT}}", conversation_context)
-            full_prompt = full_prompt.replace("{{LAST_ACTION_RESULT}}", last_action_result)
-            full_prompt = full_prompt.replace("{{NEXT_QUESTION}}", next_question)
-            full_prompt = full_prompt.replace("{{INSTRUCTION_TYPE}}", instruction_type)
-            full_prompt = full_prompt.replace("{{CURRENT_DATA_STATUS}}", current_data_status)
-            
-            # Invoke Turkish persona
-            result = await self.kernel.invoke_prompt(
-                function_name="turkish_persona_context",
-                plugin_name="turkish_persona", 
-                prompt=full_prompt
+            chat_history = self._build_chat_history(english_response, session)
+            response = await self.chat_service.get_chat_message_contents(
+                chat_history=chat_history,
+                settings=self.settings
             )
             
-            turkish_response = str(result).strip()
+            turkish_response = str(response[0]).strip() if response else ""
             
             if not turkish_response:
-                raise ValueError(f"Turkish agent returned empty response")
+                raise ValueError("Turkish agent returned empty response")
             
             # Parse XML response into multiple messages
             messages = self._parse_xml_response(turkish_response)
+            self._finish_processing(messages)
+            return messages
             
-            if DEBUG_MODE:
-                print(f"🇹🇷 Generated {len(messages)} messages: {[msg[:20]+'...' for msg in messages]}")
+        except Exception as e:
+            raise self._processing_failed(e)
+    
+    async def stream_with_context(self, english_response, session):
+        """Stream English response processing - yield each ChatBox as soon as it is closed"""
+        self._start_processing(english_response)
+        
+        try:
+            chat_history = self._build_chat_history(english_response, session)
             
-            # Log success
-            if TELEMETRY_AVAILABLE:
-                telemetry.conversation_end("turkish_persona", f"{len(messages)} messages generated")
+            turkish_response = ""
+            scan_from = 0
+            messages = []
+            async for chunks in self.chat_service.get_streaming_chat_message_contents(
+                chat_history=chat_history,
+                settings=self.settings
+            ):
+                if not chunks:
+                    continue
+                turkish_response += str(chunks[0])
+                
+                # Emit every ChatBox completed since the last chunk
+                for match in _CHATBOX_RE.finditer(turkish_response, scan_from):
+                    scan_from = match.end()
+                    message = match.group(1).strip()
+                    if message:
+                        messages.append(message)
+                        yield message
             
-            return messages
+            if not turkish_response.strip():
+                raise ValueError("Turkish agent returned empty response")
             
-        except Exception as e:
-            # Log error
-            if TELEMETRY_AVAILABLE:
-                telemetry.error("turkish_persona", str(e))
+            # No ChatBox tags streamed - fall back to full parse (other tags / plain text)
+            if not messages:
+                messages = self._parse_xml_response(turkish_response)
+                for message in messages:
+                    yield message
             
-            error_msg = f"Turkish persona processing failed: {e}"
-            print(f"❌ {error_msg}")
-            raise RuntimeError(error_msg)
+            self._finish_processing(messages)
+            
+        except Exception as e:
+            raise self._processing_failed(e)
     
     async def translate_to_persona(self, english_response, session):
         """Main interface - process with full conversation context"""
         if not session:
             raise ValueError("Turkish agent requires session context for proper operation")
         
-        return await self.process_with_context(english_response, session)
\ No newline at end of file
+        return await self.process_with_context(english_response, session)
+    
+    async def stream_to_persona(self, english_response, session):
+        """Streaming interface - yields messages one by one as the model produces them"""
+        if not session:
+            raise ValueError("Turkish agent requires session context for proper operation")
+        
+        async for message in self.stream_with_context(english_response, session):
+            yield message
@@ -3,90 +3,187 @@
 Session/Block architecture for proper conversation management
 Simple, functional approach - no dataclasses, minimal typing
 """
-import datetime
-import json
+import asyncio
+from datetime import datetime
+import hashlib
+import orjson
+import os
 import uuid
+from utils.debug_logger import get_debug_logger
+
+log = get_debug_logger("stage_manager")
+
+# History line per tracked function - unknown functions are skipped
+_ACTION_FORMATTERS = {
+    'update_data': lambda args, result: f"  - Called update_data(field='{args.get('field')}', value='{args.get('value')}') → {result}",
+    'ask_question': lambda args, result: f"  - Called ask_question(field='{args.get('field')}', message='{args.get('message')}') → Success",
+}
+
+class Block:
+    """Single conversation block - slotted since sessions keep every block in memory"""
+    
+    __slots__ = ('id', 'type', 'subtype', 'content', 'user_input', 'context', 'response', 'timestamp')
+    
+    def __init__(self, block_type, block_id=None, **fields):
+        self.id = block_id or str(uuid.uuid4())[:8]
+        self.type = block_type
+        for name in self.__slots__[2:]:
+            setattr(self, name, fields.get(name))
+    
+    def to_dict(self):
+        """JSON-ready dict - only the fields this block type uses"""
+        return {name: getattr(self, name) for name in self.__slots__ if getattr(self, name) is not None}
+    
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a block from its saved dict"""
+        fields = {key: value for key, value in data.items() if key not in ('id', 'type')}
+        return cls(data['type'], block_id=data['id'], **fields)
+
 
 class Session:
     """Manages the entire conversation lifecycle with block-based structure"""
     
     def __init__(self, session_id=None):
-        self.id = session_id or f"session_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        # Random suffix - concurrent test scenarios start sessions within the same second
+        self.id = session_id or f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
         self.blocks = []
         self.session_start_state = {}
         self.session_end_state = {}
-        self.created_at = datetime.datetime.now().isoformat()
+        self.created_at = datetime.now().isoformat()
         self.stage_manager = ConversationStageManager()
+        # Raw LLM responses live in side files - blocks only keep length + hash
+        self._raw_dir = f"data/sessions/{self.id}/raw"
+        # Rendered history lines per finished block - history is rebuilt every turn
+        self._history_lines = {}
         
     def add_programmatic_block(self, content, block_type="greeting"):
         """Add a programmatic entry (greeting, system message, etc)"""
-        block = {
-            'id': str(uuid.uuid4())[:8],
-            'type': 'programmatic',
-            'subtype': block_type,
-            'content': content,
-            'timestamp': datetime.datetime.now().isoformat()
-        }
+        block = Block(
+            'programmatic',
+            subtype=block_type,
+            content=content,
+            timestamp=datetime.now().isoformat()
+        )
         self.blocks.append(block)
         return block
         
-    def start_ai_block(self, user_input, full_prompt, functions_available, data_snapshot):
-        """Start a new AI interaction block"""
-        block = {
-            'id': str(uuid.uuid4())[:8],
-            'type': 'ai_interaction',
-            'user_input': user_input,
-            'context': {
-                'full_prompt': full_prompt,
+    def start_ai_block(self, user_input, prompt_parts, functions_available, data_snapshot):
+        """Start a new AI interaction block
+        
+        Args:
+            prompt_parts (tuple): Pieces of the full prompt (e.g. system prefix, turn prompt) -
+                joined only when the block is inspected or saved, not on every turn
+        """
+        block = Block(
+            'ai_interaction',
+            user_input=user_input,
+            context={
+                'prompt_parts': tuple(prompt_parts),
                 'functions_available': functions_available,
                 'data_state_snapshot': data_snapshot,
-                'timestamp_start': datetime.datetime.now().isoformat()
+                'timestamp_start': datetime.now().isoformat()
             },
-            'response': {
+            response={
                 'raw_response': None,
-                'actions': [],
+                'actions': [],             # STAGE 2: executed (DataManager)
+                'requested_actions': [],   # STAGE 1: requested by the LLM (Agent)
                 'final_message': None,
                 'timestamp_end': None
             }
-        }
+        )
         self.blocks.append(block)
-        return block['id']
+        return block.id
         
-    def complete_ai_block(self, block_id, raw_response, final_message):
-        """Complete an AI block with response data"""
+    def _get_ai_block(self, block_id):
+        """Find an AI interaction block by id (None if missing)"""
         for block in self.blocks:
-            if block.get('id') == block_id and block['type'] == 'ai_interaction':
-                block['response']['raw_response'] = raw_response
-                block['response']['final_message'] = final_message
-                block['response']['timestamp_end'] = datetime.datetime.now().isoformat()
-                return True
-        return False
+            if block.id == block_id and block.type == 'ai_interaction':
+                return block
+        return None
+        
+    async def complete_ai_block(self, block_id, raw_response, final_message):
+        """Complete an AI block with response data - raw text goes straight to its side file"""
+        block = self._get_ai_block(block_id)
+        if block is None:
+            return False
+        # Written now (off the event loop) so the session never holds the full responses
+        await asyncio.to_thread(self._write_raw, block_id, raw_response)
+        block.response['raw_response'] = {
+            'length': len(raw_response),
+            'hash': hashlib.blake2b(raw_response.encode(), digest_size=8).hexdigest()
+        }
+        block.response['final_message'] = final_message
+        block.response['timestamp_end'] = datetime.now().isoformat()
+        return True
+        
+    def _write_raw(self, block_id, raw_response):
+        """Blocking side-file write (runs in a worker thread)"""
+        os.makedirs(self._raw_dir, exist_ok=True)
+        # Explicit UTF-8 - orjson output is non-ASCII and the locale's encoding may not be
+        with open(f"{self._raw_dir}/{block_id}.txt", 'w', encoding='utf-8') as f:
+            f.write(raw_response)
+        
+    @staticmethod
+    def get_full_prompt(block):
+        """Full prompt text sent for an AI block"""
+        return "".join(block.context['prompt_parts'])
+    
+    @staticmethod
+    def _prompt_length(block):
+        """Prompt size without joining the parts"""
+        return sum(len(part) for part in block.context['prompt_parts'])
+    
+    def _block_to_dict(self, block):
+        """Saved form of a block - AI blocks store the joined full_prompt"""
+        data = block.to_dict()
+        if block.type == 'ai_interaction':
+            context = {'full_prompt': self.get_full_prompt(block)}
+            context.update((key, value) for key, value in data['context'].items() if key != 'prompt_parts')
+            data['context'] = context
+        return data
+        
+    def get_raw(self, block_id):
+        """Read back the full raw response stored for a block"""
+        with open(f"{self._raw_dir}/{block_id}.txt", 'r', encoding='utf-8') as f:
+            return f.read()
         
     def add_action_to_block(self, block_id, function_name, arguments, result):
         """Add a function call to the current AI block"""
-        for block in self.blocks:
-            if block.get('id') == block_id and block['type'] == 'ai_interaction':
-                action = {
-                    'function': function_name,
-                    'arguments': arguments,
-                    'result': result,
-                    'timestamp': datetime.datetime.now().isoformat()
-                }
-                block['response']['actions'].append(action)
-                return True
-        return False
+        block = self._get_ai_block(block_id)
+        if block is None:
+            return False
+        self._history_lines.pop(block_id, None)  # Widget updates can land after the block completed
+        block.response['actions'].append({
+            'function': function_name,
+            'arguments': arguments,
+            'result': result,
+            'timestamp': datetime.now().isoformat()
+        })
+        return True
+    
+    def add_requested_action(self, block_id, function_name, arguments):
+        """STAGE 1: Record a tool call the LLM requested - kept apart from executed actions"""
+        block = self._get_ai_block(block_id)
+        if block is None:
+            return False
+        block.response['requested_actions'].append({
+            'function': function_name,
+            'arguments': arguments
+        })
+        return True
     
     def add_token_usage(self, block_id, input_tokens, output_tokens):
         """Add token usage information to an AI block"""
-        for block in self.blocks:
-            if block.get('id') == block_id and block['type'] == 'ai_interaction':
-                block['response']['token_usage'] = {
-                    'input_tokens': input_tokens,
-                    'output_tokens': output_tokens,
-                    'total_tokens': input_tokens + output_tokens
-                }
-                return True
-        return False
+        block = self._get_ai_block(block_id)
+        if block is None:
+            return False
+        block.response['token_usage'] = {
+            'input_tokens': input_tokens,
+            'output_tokens': output_tokens,
+            'total_tokens': input_tokens + output_tokens
+        }
+        return True
     
     def update_session_end_state(self, final_data_state):
         """Update session end state with final data"""
@@ -102,38 +199,47 @@ class Session:
         lines = []
         
         for block in recent_blocks:
-            if block['type'] == 'programmatic':
-                # Include programmatic messages as Assistant messages
-                lines.append(f"Assistant: {block['content']}")
-            elif block['type'] == 'ai_interaction':
-                # User input
-                lines.append(f"User: {block['user_input']}")
-                
-                # Include actions taken inline with response
-                if block['response']['actions']:
-                    lines.append("Actions taken:")
-                    for action in block['response']['actions']:
-                        if action['function'] == 'update_data':
-                            field = action['arguments'].get('field')
-                            value = action['arguments'].get('value')
-                            lines.append(f"  - Called update_data(field='{field}', value='{value}') → {action['result']}")
-                        elif action['function'] == 'ask_question':
-                            field = action['arguments'].get('field')
-                            message = action['arguments'].get('message')
-                            lines.append(f"  - Called ask_question(field='{field}', message='{message}') → Success")
-                
-                # Assistant response after actions
-                if block['response']['final_message']:
-                    lines.append(f"Assistant: {block['response']['final_message']}")
+            lines.extend(self._block_history_lines(block))
             
         return "\n".join(lines).strip()
+    
+    def _block_history_lines(self, block):
+        """History lines for one block - memoized once the block can no longer change"""
+        cached = self._history_lines.get(block.id)
+        if cached is not None:
+            return cached
+        
+        lines = []
+        if block.type == 'programmatic':
+            # Include programmatic messages as Assistant messages
+            lines.append(f"Assistant: {block.content}")
+        elif block.type == 'ai_interaction':
+            # User input
+            lines.append(f"User: {block.user_input}")
+            
+            # Include actions taken inline with response
+            if block.response['actions']:
+                lines.append("Actions taken:")
+                for action in block.response['actions']:
+                    formatter = _ACTION_FORMATTERS.get(action['function'])
+                    if formatter:
+                        lines.append(formatter(action['arguments'], action['result']))
+            
+            # Assistant response after actions
+            if block.response['final_message']:
+                lines.append(f"Assistant: {block.response['final_message']}")
+        
+        # In-progress AI blocks still get actions and a final message
+        if block.type != 'ai_interaction' or block.response['timestamp_end'] is not None:
+            self._history_lines[block.id] = lines
+        return lines
         
     def get_current_block_id(self):
         """Get the ID of the most recent AI block that's not completed"""
         for block in reversed(self.blocks):
-            if (block['type'] == 'ai_interaction' and 
-                block['response']['timestamp_end'] is None):
-                return block['id']
+            if (block.type == 'ai_interaction' and 
+                block.response['timestamp_end'] is None):
+                return block.id
         return None
         
     def debug_block(self, block_id=None, show_full_prompt=False):
@@ -141,67 +247,71 @@ class Session:
         if block_id is None:
             # Get latest AI block
             for block in reversed(self.blocks):
-                if block['type'] == 'ai_interaction':
-                    block_id = block['id']
+                if block.type == 'ai_interaction':
+                    block_id = block.id
                     break
                     
         for block in self.blocks:
-            if block.get('id') == block_id:
+            if block.id == block_id:
                 debug_info = {
-                    'block_id': block['id'],
-                    'type': block['type'],
-                    'user_input': block.get('user_input', 'N/A'),
-                    'prompt_length': len(block['context']['full_prompt']) if block['type'] == 'ai_interaction' else 0,
-                    'functions_available': block['context']['functions_available'] if block['type'] == 'ai_interaction' else [],
-                    'actions_taken': [a['function'] for a in block['response']['actions']] if block['type'] == 'ai_interaction' else [],
-                    'data_snapshot': block['context']['data_state_snapshot'] if block['type'] == 'ai_interaction' else {}
+                    'block_id': block.id,
+                    'type': block.type,
+                    'user_input': block.user_input or 'N/A',
+                    'prompt_length': self._prompt_length(block) if block.type == 'ai_interaction' else 0,
+                    'functions_available': block.context['functions_available'] if block.type == 'ai_interaction' else [],
+                    'actions_taken': [a['function'] for a in block.response['actions']] if block.type == 'ai_interaction' else [],
+                    'data_snapshot': block.context['data_state_snapshot'] if block.type == 'ai_interaction' else {}
                 }
                 
-                if show_full_prompt and block['type'] == 'ai_interaction':
-                    debug_info['full_prompt'] = block['context']['full_prompt']
+                if show_full_prompt and block.type == 'ai_interaction':
+                    debug_info['full_prompt'] = self.get_full_prompt(block)
                     
                 return debug_info
         return None
         
     def print_session_flow(self):
         """Print the session flow in a clean, debuggable format"""
-        print(f"\n🔄 SESSION FLOW ({self.id})")
-        print(f"📅 Started: {self.created_at}")
-        print("=" * 60)
+        # Collected and written once - one stdout write instead of several per block
+        lines = [
+            f"\n🔄 SESSION FLOW ({self.id})",
+            f"📅 Started: {self.created_at}",
+            "=" * 60
+        ]
         
         for i, block in enumerate(self.blocks, 1):
-            if block['type'] == 'programmatic':
-                print(f"\n📍 BLOCK {i} - PROGRAMMATIC ({block['subtype']})")
-                print(f"   🤖 [{block['timestamp'].split('T')[1][:8]}] \"{block['content']}\"")
+            if block.type == 'programmatic':
+                lines.append(f"\n📍 BLOCK {i} - PROGRAMMATIC ({block.subtype})")
+                lines.append(f"   🤖 [{block.timestamp.split('T')[1][:8]}] \"{block.content}\"")
                 
-            elif block['type'] == 'ai_interaction':
-                print(f"\n📍 BLOCK {i} - AI INTERACTION")
-                print(f"   👤 USER: {block['user_input']}")
+            elif block.type == 'ai_interaction':
+                lines.append(f"\n📍 BLOCK {i} - AI INTERACTION")
+                lines.append(f"   👤 USER: {block.user_input}")
                 
                 # Context info
-                ctx = block['context']
-                print(f"   📋 CONTEXT:")
-                print(f"      - Prompt size: {len(ctx['full_prompt'])} chars")
-                print(f"      - Functions: {ctx['functions_available']}")
-                print(f"      - Data state: {list(ctx['data_state_snapshot'].keys())}")
+                ctx = block.context
+                lines.append(f"   📋 CONTEXT:")
+                lines.append(f"      - Prompt size: {self._prompt_length(block)} chars")
+                lines.append(f"      - Functions: {ctx['functions_available']}")
+                lines.append(f"      - Data state: {list(ctx['data_state_snapshot'].keys())}")
                 
                 # Response info
-                resp = block['response']
+                resp = block.response
                 if resp['timestamp_end']:
-                    print(f"   🤖 RESPONSE:")
+                    lines.append(f"   🤖 RESPONSE:")
                     
                     # Actions
                     for action in resp['actions']:
                         args_str = ", ".join([f"{k}='{v}'" for k, v in action['arguments'].items()])
-                        print(f"      🔧 {action['function']}({args_str}) → {action['result']}")
+                        lines.append(f"      🔧 {action['function']}({args_str}) → {action['result']}")
                     
                     # Final message
                     if resp['final_message']:
-                        print(f"      💬 \"{resp['final_message']}\"")
+                        lines.append(f"      💬 \"{resp['final_message']}\"")
                 else:
-                    print(f"   ⏳ IN PROGRESS...")
+                    lines.append(f"   ⏳ IN PROGRESS...")
                     
-        print("=" * 60)
+        lines.append("=" * 60)
+        print("\n".join(lines))
         
     def save_to_file(self, filepath=None):
         """Save session to JSON file"""
@@ -211,23 +321,26 @@ class Session:
         session_data = {
             'id': self.id,
             'created_at': self.created_at,
-            'blocks': self.blocks,
+            'blocks': [self._block_to_dict(block) for block in self.blocks],
             'session_start_state': self.session_start_state,
             'session_end_state': self.session_end_state
         }
         
-        with open(filepath, 'w') as f:
-            json.dump(session_data, f, indent=2)
+        with open(filepath, 'wb') as f:
+            f.write(orjson.dumps(session_data, option=orjson.OPT_INDENT_2))
             
     @classmethod
     def load_from_file(cls, filepath):
         """Load session from JSON file"""
-        with open(filepath, 'r') as f:
-            data = json.load(f)
+        with open(filepath, 'rb') as f:
+            data = orjson.loads(f.read())
             
         session = cls(session_id=data['id'])
         session.created_at = data['created_at']
-        session.blocks = data['blocks']
+        session.blocks = [Block.from_dict(block) for block in data['blocks']]
+        for block in session.blocks:
+            if block.type == 'ai_interaction':
+                block.context['prompt_parts'] = (block.context.pop('full_prompt'),)
         session.session_start_state = data.get('session_start_state', {})
         session.session_end_state = data.get('session_end_state', {})
         
@@ -257,8 +370,8 @@ class ConversationStageManager:
         """Enable test mode and load test responses"""
         self.test_mode = True
         try:
-            with open(test_data_file, 'r') as f:
-                self.test_data = json.load(f)
+            with open(test_data_file, 'rb') as f:
+                self.test_data = orjson.loads(f.read())
                 print(f"    📋 Stage Manager: Loaded test data from {test_data_file}")
         except Exception as e:
             print(f"    ⚠️ Stage Manager: Error loading test data: {e}")
@@ -278,7 +391,7 @@ class ConversationStageManager:
             'function': function_name,
             'arguments': arguments,
             'result': result,
-            'timestamp': datetime.datetime.now().isoformat()
+            'timestamp': datetime.now().isoformat()
         }
         self.function_call_log.append(call_info)
         
@@ -308,11 +421,11 @@ class ConversationStageManager:
             field = arguments.get('field', '').lower()
             value = arguments.get('value', '')
             final_value = arguments.get('final_value', value)  # In case of type conversion
-            print(f"    ✅ Stage Manager: Data updated - {field}: {final_value}")
+            log.debug("    ✅ Stage Manager: Data updated - %s: %s", field, final_value)
             
             # Track update completion for stage management
             if self.last_question_field == field:
-                print(f"    🎯 Stage Manager: Question '{field}' completed with update")
+                log.debug("    🎯 Stage Manager: Question '%s' completed with update", field)
                 self.current_stage = "data_updated"
     
     def get_pending_test_response(self):
@@ -326,7 +439,7 @@ class ConversationStageManager:
     def flag_widget_needed(self, widget_info):
         """Flag that a widget needs to be executed after LLM response"""
         self.pending_widget = widget_info
-        print(f"    🎛️ Stage Manager: Widget flagged for field '{widget_info['field']}'")
+        log.debug("    🎛️ Stage Manager: Widget flagged for field '%s'", widget_info['field'])
     
     def get_pending_widget(self):
         """Get and clear pending widget"""
@@ -4,13 +4,21 @@ Simple Telemetry Collector for Semantic Kernel
 Collects events as structured data instead of raw logs
 """
 
-import json
-import time
 import logging
-import sys
-import hashlib
+import os
+import orjson
+import time
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any
+from utils.hash_utils import short_hash
+
+# Response shapes accepted by process_kernel_response, keyed by type name:
+# chat service returns a list of messages, kernel.invoke returns a FunctionResult
+_RESPONSE_MESSAGES = {
+    'list': lambda response: response,
+    'ChatMessageContent': lambda response: [response],
+    'FunctionResult': lambda response: response.value if isinstance(response.value, list) else [response.value],
+}
 
 
 class PromptEvolutionHandler(logging.Handler):
@@ -77,7 +85,7 @@ class PromptEvolutionHandler(logging.Handler):
         """Process the evolution of messages in the conversation"""
         try:
             # Create a simple hash of the messages for comparison
-            prompt_hash = hashlib.md5(messages_str.encode()).hexdigest()[:8]
+            prompt_hash = short_hash(messages_str)
             
             # Count messages to determine evolution stage
             message_count = messages_str.count("'role':")
@@ -131,6 +139,7 @@ class TelemetryCollector:
     def __init__(self):
         self.events: List[Dict[str, Any]] = []
         self.event_stack: List[str] = []  # For hierarchical tracking
+        self._top_level_by_id: Dict[str, Dict[str, Any]] = {}  # Parent lookup without scanning events
         self.logging_enabled = False
         self.traditional_log_file = None
         # Don't set up logging automatically - wait for enable() call
@@ -156,7 +165,6 @@ class TelemetryCollector:
         self.traditional_log_file = f"data/telemetry/telemetry_dump_{timestamp}.log"
         
         # Ensure directory exists
-        import os
         os.makedirs("data/telemetry", exist_ok=True)
         
         # Create custom formatter for handling long prompts
@@ -224,16 +232,16 @@ class TelemetryCollector:
             "children": []
         }
         
-        # Add to parent if we're in a hierarchical context
-        if self.event_stack and self.events:
-            parent_id = self.event_stack[-1]
-            for event_item in self.events:
-                if event_item["id"] == parent_id:
-                    event_item["children"].append(event)
-                    return event
+        # Add to parent if we're in a hierarchical context (parents are top-level events)
+        if self.event_stack:
+            parent = self._top_level_by_id.get(self.event_stack[-1])
+            if parent is not None:
+                parent["children"].append(event)
+                return event
         
-        # Top-level event
+        # Top-level event - first one wins on an id collision, as the old linear scan did
         self.events.append(event)
+        self._top_level_by_id.setdefault(event["id"], event)
         return event
     
     def conversation_start(self, conversation_id: str, user_input: str):
@@ -324,7 +332,7 @@ class TelemetryCollector:
     
     def prompt_evolved(self, original_hash: str, evolved_messages: str, additions: str, message_count: int):
         """Track evolved prompt (subsequent requests with function results)"""
-        evolved_hash = hashlib.md5(evolved_messages.encode()).hexdigest()[:8]
+        evolved_hash = short_hash(evolved_messages)
         
         return self._create_event("PROMPT_EVOLVED", {
             "original_hash": original_hash,
@@ -350,7 +358,7 @@ class TelemetryCollector:
         })["id"]
     
     def process_kernel_response(self, response, user_input: str, context: Dict[str, Any] = None):
-        """Process response from kernel.invoke() and extract telemetry data"""
+        """Process response from chat service or kernel.invoke() and extract telemetry data"""
         try:
             # Track the response event
             response_event = self._create_event("KERNEL_RESPONSE", {
@@ -358,39 +366,30 @@ class TelemetryCollector:
                 "context": context or {}
             })
             
-            # Extract response value
-            if hasattr(response, 'value'):
-                # Handle list of messages or single message
-                messages = response.value if isinstance(response.value, list) else [response.value]
+            # Normalize response to messages - dispatch on type name keeps SK imports out of telemetry
+            to_messages = _RESPONSE_MESSAGES.get(type(response).__name__)
+            messages = to_messages(response) if to_messages else []
+            
+            for message in messages:
+                # Track AI response
+                self.ai_response(str(message.content), context.get('model', 'gpt-4o-mini'))
                 
-                for message in messages:
-                    # Extract content
-                    if hasattr(message, 'content'):
-                        content = str(message.content)
-                        
-                        # Track AI response
-                        self.ai_response(content, context.get('model', 'gpt-4o-mini'))
-                        
-                        # Extract token usage if available
-                        if hasattr(message, 'metadata') and 'usage' in message.metadata:
-                            usage = message.metadata['usage']
-                            self.token_usage(
-                                usage.prompt_tokens,
-                                usage.completion_tokens,
-                                usage.prompt_tokens + usage.completion_tokens
-                            )
-                    
-                    # Extract function calls from message items
-                    if hasattr(message, 'items'):
-                        for item in message.items:
-                            if hasattr(item, 'function_call_result'):
-                                result = item.function_call_result
-                                
-                                # Track function call completion
-                                self._create_event("FUNCTION_EXECUTED", {
-                                    "function_name": result.function_name,
-                                    "result": result.result
-                                })
+                # Extract token usage if available
+                usage = message.metadata.get('usage')
+                if usage:
+                    self.token_usage(
+                        usage.prompt_tokens,
+                        usage.completion_tokens,
+                        usage.prompt_tokens + usage.completion_tokens
+                    )
+                
+                # Track function call completions from message items
+                for item in message.items:
+                    if type(item).__name__ == 'FunctionResultContent':
+                        self._create_event("FUNCTION_EXECUTED", {
+                            "function_name": item.function_name,
+                            "result": str(item.result)
+                        })
             
             return response_event["id"]
             
@@ -415,6 +414,7 @@ class TelemetryCollector:
         """Clear all events"""
         self.events = []
         self.event_stack = []
+        self._top_level_by_id = {}
     
     def to_log_file(self, filename: str):
         """Convert structured events to readable log file"""
@@ -438,7 +438,7 @@ class TelemetryCollector:
             # Dump everything as JSON for complete data preservation
             f.write("RAW EVENT DATA:\n")
             f.write("-" * 50 + "\n")
-            json.dump(self.events, f, indent=2, default=str)
+            f.write(self._events_json().decode())
             f.write("\n\n")
             
             # Also include human readable version
@@ -491,8 +491,12 @@ class TelemetryCollector:
     
     def to_json_file(self, filename: str):
         """Save events as JSON for programmatic access"""
-        with open(filename, 'w') as f:
-            json.dump(self.events, f, indent=2, default=str)
+        with open(filename, 'wb') as f:
+            f.write(self._events_json())
+    
+    def _events_json(self) -> bytes:
+        """Indented JSON of all events - non-JSON values (SK objects) fall back to str()"""
+        return orjson.dumps(self.events, default=str, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
 
 
 # Global instance for easy access
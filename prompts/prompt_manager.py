@@ -6,6 +6,8 @@ Handles all prompt-related logic and template loading
 
 import os
 from typing import Dict, Any, Optional
+from utils.file_loader import load_text
+from utils.hash_utils import short_hash
 
 
 class PromptManager:
@@ -14,6 +16,8 @@ class PromptManager:
     def __init__(self, templates_dir="prompts/templates"):
         self.templates_dir = templates_dir
         self._templates = {}
+        self._prompt_prefix = ""
+        self._system_prompt_hash = ""
         self._load_templates()
     
     def _load_templates(self):
@@ -26,13 +30,22 @@ class PromptManager:
         
         for template_name, filename in template_files.items():
             filepath = os.path.join(self.templates_dir, filename)
-            with open(filepath, 'r', encoding='utf-8') as f:
-                self._templates[template_name] = f.read().strip()
+            self._templates[template_name] = load_text(filepath).strip()
+        self._build_prompt_prefix()
+    
+    def _build_prompt_prefix(self):
+        """Precompute the static part of the conversation prompt - only the tail changes per turn"""
+        self._prompt_prefix = self._templates['system_prompt'] + "\n\n"
+        self._system_prompt_hash = short_hash(self._templates['system_prompt'])
     
     def get_system_prompt(self) -> str:
         """Get the main system prompt for agent reasoning"""
         return self._templates['system_prompt']
     
+    def get_system_prompt_hash(self) -> str:
+        """Short hash of the system prompt - computed when the prompt is loaded, not per turn"""
+        return self._system_prompt_hash
+    
     def get_greeting(self, data_state: Dict[str, Any]) -> str:
         """Get appropriate greeting based on current data state"""
         # Check if user has any existing data
@@ -52,21 +65,30 @@ class PromptManager:
         user_input_placeholder: str = "{{$user_input}}"
     ) -> str:
         """Build the full conversation prompt with all context"""
-        system_prompt = self.get_system_prompt()
-        
-        # Build the full prompt with context
-        full_prompt = f"""{system_prompt}
-
-CONVERSATION HISTORY:
-{conversation_history}
-
-CURRENT DATA STATUS:
-{current_status}
-
-User: {user_input_placeholder}
-Assistant: """
-        
-        return full_prompt
+        return self.with_system_prompt(
+            self.build_turn_prompt(conversation_history, current_status, user_input_placeholder)
+        )
+    
+    def build_turn_prompt(
+        self,
+        conversation_history: str,
+        current_status: str,
+        user_input: str
+    ) -> str:
+        """Build only the per-turn part of the prompt (everything after the system prompt)"""
+        return (
+            f"CONVERSATION HISTORY:\n{conversation_history}\n\n"
+            f"CURRENT DATA STATUS:\n{current_status}\n\n"
+            f"User: {user_input}\nAssistant: "
+        )
+    
+    def with_system_prompt(self, turn_prompt: str) -> str:
+        """Prepend the precomputed system prompt prefix to a per-turn prompt"""
+        return self._prompt_prefix + turn_prompt
+    
+    def prompt_parts(self, turn_prompt: str) -> tuple:
+        """Same text as with_system_prompt, unjoined - (system prefix, turn prompt)"""
+        return (self._prompt_prefix, turn_prompt)
     
     def get_template(self, template_name: str) -> Optional[str]:
         """Get a specific template by name"""
@@ -78,6 +100,7 @@ Assistant: """
     
     def reload_templates(self):
         """Reload all templates from disk"""
+        load_text.cache_clear()
         self._templates.clear()
         self._load_templates()
         print("🔄 Prompt templates reloaded")
@@ -85,6 +108,8 @@ Assistant: """
     def add_custom_template(self, name: str, content: str):
         """Add a custom template programmatically"""
         self._templates[name] = content
+        if name == 'system_prompt':
+            self._build_prompt_prefix()
     
     def get_debug_info(self) -> Dict[str, Any]:
         """Get debug information about loaded templates"""
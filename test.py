@@ -3,48 +3,98 @@
 Core Agent Test Runner - Clean test automation for data collection scenarios
 """
 
-import json
+import orjson
 import sys
 import os
 import asyncio
-from pathlib import Path
+import contextvars
+import importlib
 from datetime import datetime
+from functools import lru_cache
 from ui.chat_ui import print_system_message, print_user_message
 
-def load_test_scenarios():
-    """Load test scenarios from test.json"""
-    with open("data/test.json", 'r') as f:
-        data = json.load(f)
-    return data.get("test_scenarios", [])
+# Scenarios run concurrently - each one gets its own data file so runs never share state
+MAX_CONCURRENT_TESTS = 4
+TEST_DATA_DIR = ".test_results/data"
+RESULTS_DIR = ".test_results"
+# One file per scenario instead of the run's aggregated .jsonl (for debugging a single result)
+SPLIT_RESULTS = "--split-results" in sys.argv
 
-def setup_test_data(scenario):
-    """Setup test data - only modify if existing_data specified"""
-    existing_data = scenario.get("existing_data", {})
-    
-    if existing_data:
-        # Load current data.json and update with pre-filled fields
-        with open("data/data.json", 'r') as f:
-            current_data = json.load(f)
-        
-        current_data.update(existing_data)
-        
-        with open("data/data.json", 'w') as f:
-            json.dump(current_data, f, indent=2)
-            
-        return current_data
+# Output of the scenario running in the current task - None outside a concurrent run
+_scenario_output = contextvars.ContextVar("scenario_output", default=None)
+
+class _ScenarioStdout:
+    """sys.stdout proxy for concurrent runs - each scenario's output is buffered and printed as one block"""
+    
+    def __init__(self, stream):
+        self._stream = stream
+    
+    def write(self, text):
+        buffer = _scenario_output.get()
+        if buffer is None:
+            return self._stream.write(text)
+        buffer.append(text)
+        return len(text)
     
-    # No existing_data - use current data.json as-is
-    with open("data/data.json", 'r') as f:
-        return json.load(f)
+    def flush(self):
+        self._stream.flush()
+    
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
 
-def evaluate_test(scenario):
-    """Evaluate test result - compare actual vs expected"""
-    if not os.path.exists("data/data.json"):
-        return False, [{"error": "No final data found"}], {}
+@lru_cache(maxsize=1)
+def load_test_scenarios():
+    """Load test scenarios from test.json - parsed once per process (cache_clear() after editing the file)"""
+    with open("data/test.json", 'rb') as f:
+        data = orjson.loads(f.read())
+    return tuple(data.get("test_scenarios", []))
+
+def _read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def _write_bytes(path, payload):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(payload)
+
+def _write_bytes_if_changed(path, payload):
+    """Write payload unless the file already holds exactly these bytes - returns True if written"""
+    try:
+        if _read_bytes(path) == payload:
+            return False
+    except FileNotFoundError:
+        pass
+    _write_bytes(path, payload)
+    return True
+
+async def _read_json(path):
+    """Read a JSON file off the event loop - concurrent scenarios keep running"""
+    return orjson.loads(await asyncio.to_thread(_read_bytes, path))
+
+async def _write_json(path, obj):
+    """Write indented JSON off the event loop (parent directory created as needed)"""
+    await asyncio.to_thread(_write_bytes, path, orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+
+def get_test_data_file(scenario):
+    """Per-scenario data file so concurrent tests don't clobber data/data.json"""
+    test_name = scenario['name'].replace(' ', '_').lower()
+    return f"{TEST_DATA_DIR}/{test_name}.json"
+
+async def setup_test_data(scenario, data_file):
+    """Create the scenario's data file from data.json plus any existing_data"""
+    current_data = await _read_json("data/data.json")
+    
+    # Pre-fill fields from the scenario
+    current_data.update(scenario.get("existing_data", {}))
     
-    with open("data/data.json", 'r') as f:
-        final_data = json.load(f)
+    # A scenario whose file still holds this start state (e.g. the previous run changed nothing) is not rewritten
+    await asyncio.to_thread(_write_bytes_if_changed, data_file, orjson.dumps(current_data, option=orjson.OPT_INDENT_2))
     
+    return current_data
+
+def evaluate_test(scenario, final_data):
+    """Evaluate test result - compare actual vs expected"""
     expected_data = scenario.get("expected_result", {})
     mismatches = []
     
@@ -59,6 +109,10 @@ def evaluate_test(scenario):
     
     return len(mismatches) == 0, mismatches, final_data
 
+def _completion(data):
+    """(filled, total) field counts of a data dict - one pass over its values"""
+    return sum(1 for v in data.values() if v is not None), len(data)
+
 def print_test_summary(test_num, scenario, test_passed, mismatches, final_data, start_data):
     """Print concise test summary"""
     status = "✅ PASS" if test_passed else "❌ FAIL"
@@ -77,19 +131,15 @@ def print_test_summary(test_num, scenario, test_passed, mismatches, final_data,
             print(f"    • ... and {len(mismatches) - 3} more")
     
     # Show data completion stats
-    filled_fields = sum(1 for v in final_data.values() if v is not None)
-    total_fields = len(final_data)
-    pre_filled = sum(1 for v in start_data.values() if v is not None)
+    filled_fields, total_fields = _completion(final_data)
+    pre_filled, _ = _completion(start_data)
     
     print(f"    Data: {pre_filled}→{filled_fields}/{total_fields} fields")
 
-def save_session_result(scenario, final_data, test_passed, mismatches, session_id):
-    """Save complete session result with test evaluation"""
-    import os
-    results_dir = ".test_results"
-    os.makedirs(results_dir, exist_ok=True)
-    
+async def save_session_result(scenario, final_data, test_passed, mismatches, session_id, results_log=None):
+    """Save complete session result with test evaluation - one line in results_log if given, else its own file"""
     test_name = scenario['name'].replace(' ', '_').lower()
+    filled_fields, total_fields = _completion(final_data)
     
     session_result = {
         "test_info": {
@@ -109,47 +159,63 @@ def save_session_result(scenario, final_data, test_passed, mismatches, session_i
             "mismatches": mismatches
         },
         "data_completion": {
-            "filled_fields": sum(1 for v in final_data.values() if v is not None),
-            "total_fields": len(final_data),
-            "completion_rate": sum(1 for v in final_data.values() if v is not None) / len(final_data) if final_data else 0
+            "filled_fields": filled_fields,
+            "total_fields": total_fields,
+            "completion_rate": filled_fields / total_fields if total_fields else 0
         }
     }
     
-    result_file = f"{results_dir}/{test_name}.json"
-    with open(result_file, 'w') as f:
-        json.dump(session_result, f, indent=2)
+    if results_log is not None:
+        # Single buffered write per result - lines from concurrent scenarios never interleave
+        results_log.write(orjson.dumps(session_result, option=orjson.OPT_APPEND_NEWLINE))
+        return
+    
+    result_file = f"{RESULTS_DIR}/{test_name}.json"
+    await _write_json(result_file, session_result)
     
     status = "✅ PASS" if test_passed else "❌ FAIL"
     print(f"    💾 Session result saved: {result_file} ({status})")
 
-async def run_core_agent_test(test_inputs, test_name="test"):
-    """Run core agent test with provided inputs directly (no file overwriting)"""
-    # Set up flags before import
-    import sys
-    original_argv = sys.argv.copy()
+def open_results_log():
+    """Open a full run's .jsonl results file - results are streamed to it as scenarios finish"""
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    return open(f"{RESULTS_DIR}/run_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl", 'ab')
+
+def _import_agent_modules():
+    """Import agent modules with test flags - modules read sys.argv at import time"""
+    # Swap argv only around the imports: concurrent tests must not see each other's swap
+    original_argv = sys.argv
     sys.argv = ["test.py", "--test", "--core-agent"]
-    
     try:
-        # Import and setup  
         from core.agent import Agent
-        from app import ConversationHandler
-        
-        # Initialize agent
-        agent = Agent(debug_mode=False)
-        await agent.initialize()
-        
-        # Start session
-        session = agent.start_session()
-        
-        # Create test conversation handler with automation
-        conversation_handler = TestConversationHandler(agent, test_name)
-        await conversation_handler.run_test_mode(test_data=test_inputs)
-        
-        return agent
-        
+        # Imported only so their module-level flags see the test argv - used later via lazy imports
+        importlib.import_module("app")
+        importlib.import_module("ui.widget_handler")
     finally:
-        # Restore original argv
         sys.argv = original_argv
+    return Agent
+
+async def _close_openai_client():
+    """Release the pooled OpenAI client shared by all scenarios"""
+    from core.tool_registry import close_openai_client
+    await close_openai_client()
+
+async def run_core_agent_test(test_inputs, test_name="test", data_file="data/data.json"):
+    """Run core agent test with provided inputs against the given data file"""
+    Agent = _import_agent_modules()
+    
+    # Initialize agent
+    agent = Agent(debug_mode=False, data_file=data_file)
+    await agent.initialize()
+    
+    # Start session
+    session = agent.start_session()
+    
+    # Create test conversation handler with automation
+    conversation_handler = TestConversationHandler(agent, test_name)
+    await conversation_handler.run_test_mode(test_data=test_inputs)
+    
+    return agent
 
 class TestConversationHandler:
     """Test automation handler - simulates user input for automated testing"""
@@ -160,12 +226,12 @@ class TestConversationHandler:
         self.agent = agent
         self.test_name = test_name
         
-    def _get_next_test_input(self, session):
+    async def _get_next_test_input(self, session):
         """Test automation: get next simulated user input"""
         # Check for pending widget first (highest priority)
         widget_info = session.stage_manager.get_pending_widget()
         if widget_info:
-            return self._execute_test_widget(widget_info)
+            return await self._execute_test_widget(widget_info)
         
         # Check for test mode automation  
         test_response = session.stage_manager.get_pending_test_response()
@@ -177,43 +243,16 @@ class TestConversationHandler:
         print(f"    🤖 TEST MODE: No question detected, continuing conversation")
         return "Please continue, try to use available functions_calls correctly."
     
-    def _execute_test_widget(self, widget_info):
+    async def _execute_test_widget(self, widget_info):
         """Execute widget with test automation"""
-        # Get test value for this field
+        # Get test value for this field - StageManager always has a test_data dict
         session = self.agent.get_session()
-        field = widget_info["field"]
-        test_value = None
+        test_value = session.stage_manager.test_data.get(widget_info["field"])
         
-        if (hasattr(session.stage_manager, 'test_data') and 
-            session.stage_manager.test_data and 
-            field in session.stage_manager.test_data):
-            test_value = session.stage_manager.test_data[field]
-        
-        # Initialize widget handler with test automation
-        from ui.widget_handler import WidgetHandler
-        widget_handler = WidgetHandler()
-        
-        # Execute widget with test value
-        selected_value = widget_handler.show_widget_interface(
-            widget_info["question_structure"], 
-            test_value=test_value
-        )
+        # Same widget execution + update_data + hidden context as the interactive app
+        selected_value = await self.base_handler._execute_widget(widget_info, test_value=test_value)
         
         if selected_value:
-            # Auto-call update_data with selected value
-            update_result = self.agent.data_manager.update_data(widget_info["field"], selected_value)
-            print(f"    ✅ WIDGET: Auto-updated {widget_info['field']} = {selected_value}")
-            
-            # Store completion info for hidden LLM context injection
-            widget_completion = {
-                "field": widget_info["field"],
-                "selected_value": selected_value,
-                "update_result": update_result
-            }
-            
-            # Store in session for next LLM call context injection
-            session.stage_manager.widget_completion = widget_completion
-            
             print(f"    🎛️ WIDGET: Selected '{selected_value}', using as next user input")
             return selected_value
         
@@ -239,43 +278,50 @@ class TestConversationHandler:
         user_input = "Hello, I need help filling out my data."
         turn_number = 0
         
-        while not self.base_handler._is_complete() and turn_number < 20:  # Safety limit
+        # Loop steps bound once - the handler's methods don't change between turns
+        is_complete = self.base_handler._is_complete
+        process_input = self.base_handler._process_input
+        display_agent_message = self.base_handler._display_agent_message
+        get_next_test_input = self._get_next_test_input
+        
+        while not is_complete() and turn_number < 20:  # Safety limit
             print_user_message(user_input)
             
             # Process input through agent
-            response = await self.base_handler._process_input(user_input, turn_number=turn_number)
-            await self.base_handler._display_agent_message(response)
+            response = await process_input(user_input, turn_number=turn_number)
+            await display_agent_message(response)
             
             # Check if conversation is complete
-            if self.base_handler._is_complete():
+            if is_complete():
                 print_system_message("✅ All data collected! Conversation complete.")
                 break
             
             # Get next test input (handles both widgets and regular automation)
-            user_input = self._get_next_test_input(session)
+            user_input = await get_next_test_input(session)
             
             turn_number += 1
 
-async def run_test_scenario(scenario, test_number=None):
+async def run_test_scenario(scenario, test_number=None, results_log=None):
     """Run a single test scenario and return results"""
-    start_data = setup_test_data(scenario)
+    data_file = get_test_data_file(scenario)
+    start_data = await setup_test_data(scenario, data_file)
     test_inputs = scenario.get("inputs", {})
     test_name = scenario['name'].replace(' ', '_').lower()
     
     try:
-        agent = await run_core_agent_test(test_inputs, test_name)
+        agent = await run_core_agent_test(test_inputs, test_name, data_file)
     except Exception as e:
         error_msg = f"❌ CRASH {scenario['name']} - {str(e)}"
         if test_number:
             print(error_msg)
         return None, error_msg
     
-    # Evaluate results
-    test_passed, mismatches, final_data = evaluate_test(scenario)
+    # Evaluate results against the agent's in-memory data - already flushed to data_file, no re-read
+    test_passed, mismatches, final_data = evaluate_test(scenario, agent.data_manager.load_data())
     
     # Save session result
     session = agent.get_session()
-    save_session_result(scenario, final_data, test_passed, mismatches, session.id)
+    await save_session_result(scenario, final_data, test_passed, mismatches, session.id, results_log)
     
     # Print summary
     display_number = test_number if test_number else ""
@@ -292,7 +338,7 @@ def list_tests():
         profile = scenario.get("profile", "generic")
         existing = scenario.get("existing_data", {})
         
-        filled_count = sum(1 for v in existing.values() if v is not None) if existing else 0
+        filled_count, _ = _completion(existing or {})
         
         print(f"  {i:2d}. {name} ({profile}) - {filled_count} pre-filled")
     print()
@@ -300,8 +346,10 @@ def list_tests():
 async def main():
     """Main test runner with aggregated results"""
     
+    args = [arg for arg in sys.argv[1:] if arg != "--split-results"]
+    
     # No arguments = run all tests
-    if len(sys.argv) < 2:
+    if not args:
         scenarios = load_test_scenarios()
         print(f"🧪 Core Agent Test Suite - {len(scenarios)} scenarios")
         print("=" * 60)
@@ -309,8 +357,43 @@ async def main():
         passed_tests = 0
         failed_tests = 0
         
-        for i, scenario in enumerate(scenarios, 1):
-            result, error = await run_test_scenario(scenario, i)
+        # Scenarios are independent LLM conversations - run them concurrently
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_TESTS)
+        # Session results are streamed to one .jsonl file as each scenario finishes
+        results_log = None if SPLIT_RESULTS else open_results_log()
+        
+        # Concurrent turns would interleave on stdout - each scenario's output is printed when it finishes
+        stdout = sys.stdout
+        sys.stdout = _ScenarioStdout(stdout)
+        
+        async def run_bounded(scenario, test_number):
+            async with semaphore:
+                output = []
+                _scenario_output.set(output)  # Task-local - the gather task runs in its own context
+                try:
+                    return await run_test_scenario(scenario, test_number, results_log)
+                finally:
+                    _scenario_output.set(None)
+                    stdout.write(f"\n{'─' * 60}\n[{test_number}] {scenario['name']}\n{''.join(output)}")
+                    stdout.flush()
+        
+        try:
+            # return_exceptions: one scenario failing outside the agent run must not close the shared
+            # client and results file under the others - it is counted as a crash below
+            results = await asyncio.gather(
+                *(run_bounded(scenario, i) for i, scenario in enumerate(scenarios, 1)),
+                return_exceptions=True
+            )
+        finally:
+            sys.stdout = stdout
+            await _close_openai_client()
+            if results_log is not None:
+                results_log.close()
+        
+        for i, (scenario, outcome) in enumerate(zip(scenarios, results), 1):
+            if isinstance(outcome, BaseException):
+                outcome = (None, f"❌ CRASH {scenario['name']} - {outcome}")
+            result, error = outcome
             if result is None:  # Crashed
                 print(f"  {i:2d}. {error}")
                 failed_tests += 1
@@ -321,22 +404,24 @@ async def main():
         
         print("=" * 60)
         print(f"📊 Results: {passed_tests} passed, {failed_tests} failed")
+        if results_log is not None:
+            print(f"💾 Session results saved: {results_log.name}")
         return
     
-    command = sys.argv[1]
+    command = args[0]
     
     if command == "list":
         list_tests()
         return
     
     if command == "run":
-        if len(sys.argv) < 3:
+        if len(args) < 2:
             print("❌ Please specify test number")
             list_tests()
             return
         
         try:
-            test_number = int(sys.argv[2])
+            test_number = int(args[1])
         except ValueError:
             print("❌ Test number must be an integer")
             return
@@ -350,11 +435,14 @@ async def main():
         scenario = scenarios[test_number - 1]
         print(f"🧪 Running: {scenario['name']} ({scenario.get('profile', 'generic')})")
         
-        await run_test_scenario(scenario, test_number)
+        try:
+            await run_test_scenario(scenario, test_number)
+        finally:
+            await _close_openai_client()
     
     else:
         print(f"❌ Unknown command: {command}")
-        print("Use 'list' or 'run <test_number>'")
+        print("Use 'list' or 'run <test_number>' (add --split-results to write one result file per scenario)")
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
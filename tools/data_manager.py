@@ -4,10 +4,17 @@ DataManager - Handles data.json operations with case-insensitive field names
 Provides kernel functions for updating and querying user data
 """
 
-import json
+import asyncio
+import os
+import re
 import sys
+import tempfile
+import orjson
+from contextlib import asynccontextmanager
+from datetime import datetime
 from semantic_kernel.functions import kernel_function
-from semantic_kernel.prompt_template.input_variable import InputVariable
+from utils.debug_logger import get_debug_logger
+from utils.file_loader import load_json
 
 # Check for debug mode
 DEBUG_MODE = "--debug" in sys.argv
@@ -21,6 +28,73 @@ if DEBUG_MODE:
     except ImportError:
         pass
 
+log = get_debug_logger("data_manager")
+
+# Plain decimal number (no sign, exponent, inf/nan) - checked before float() so bad input never raises
+_DECIMAL_RE = re.compile(r"\d+\.?\d*|\.\d+")
+
+def _to_whole_number(value):
+    """Whole number or None - isdecimal() check means int() never raises"""
+    clean_value = value.strip()
+    return int(clean_value) if clean_value.isdecimal() else None
+
+def _to_measurement(units):
+    """Build a converter that strips unit words and parses a plain decimal, None if invalid"""
+    def convert(value):
+        clean_value = value
+        for unit in units:
+            clean_value = clean_value.replace(unit, '')
+        clean_value = clean_value.strip()
+        return float(clean_value) if _DECIMAL_RE.fullmatch(clean_value) else None
+    return convert
+
+# Typed fields: converter + expected format for the error message.
+# Fields not listed here (widget-based) are stored as strings.
+_FIELD_CONVERTERS = {
+    "age": (_to_whole_number, "a whole number"),
+    "height": (_to_measurement(('cm', 'centimeter')), "a number in centimeters"),
+    "weight": (_to_measurement(('kg', 'kilo')), "a number in kilograms"),
+}
+
+# One <*_priority> block of a FINAL_RECOMMENDATION: level, explanation, action list
+_PRIORITY_RE = re.compile(
+    r'<(\w+_priority)>\s*<explanation>(.*?)</explanation>\s*<action_list>\[(.*?)\]</action_list>\s*</\w+_priority>',
+    re.DOTALL
+)
+
+# Process umask, read once at import (os.umask can only be read by setting it) - applied to
+# atomic writes so they get the same permissions a plain open() would create
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def _atomic_write(path, payload):
+    """Blocking atomic write - unique temp file next to path, renamed over it once fully written"""
+    # Unique temp name: concurrent writers of the same path never share (and truncate) a temp file
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        os.fchmod(fd, 0o666 & ~_UMASK)  # mkstemp creates 0600 - match open() under the user's umask
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)  # Buffered file write loops until every byte is written
+            f.flush()
+            os.fsync(f.fileno())  # On disk before the rename makes it the real file
+        os.replace(tmp_file, path)
+    except BaseException:
+        os.unlink(tmp_file)
+        raise
+
+# Per-field status line templates - the schema is fixed by data.json, so each
+# field's label is formatted once and reused on every prompt assembly
+_FIELD_TEMPLATES = {}
+
+def _field_templates(field):
+    """Return (filled_template, missing_line) for a field, built on first use"""
+    templates = _FIELD_TEMPLATES.get(field)
+    if templates is None:
+        label = field.capitalize()
+        templates = (f"- {label}: {{}}", f"• {label}: null")
+        _FIELD_TEMPLATES[field] = templates
+    return templates
+
 class DataManager:
     """Manages the simple data.json file
     
@@ -28,6 +102,9 @@ class DataManager:
     Both needed for debugging: LLM behavior vs function execution vs routing issues.
     """
     
+    __slots__ = ('data_file', 'widget_config_file', 'session', 'current_block_id',
+                 'widget_config', 'widget_handler', '_data', '_dirty', '_save_lock', '_derived_cache')
+    
     def __init__(self, data_file="data/data.json", session=None, current_block_id=None):
         self.data_file = data_file
         self.widget_config_file = "data/widget_config.json"
@@ -35,6 +112,11 @@ class DataManager:
         self.current_block_id = current_block_id
         self.widget_config = self._load_widget_config()
         self.widget_handler = None  # Lazy load when needed
+        # In-memory copy of data.json - read once; this instance is the file's only writer
+        self._data = None
+        self._dirty = False  # Updates not yet written - see flush()
+        self._save_lock = asyncio.Lock()  # Held while a write is in flight
+        self._derived_cache = {}  # Status reports and snapshot derived from _data - cleared whenever data changes
         
     def _log_function_call(self, function_name, inputs, outputs, metadata=None):
         """Unified telemetry logging for function calls"""
@@ -51,6 +133,7 @@ class DataManager:
     
     def _handle_error(self, error_type, field, value, message):
         """Unified error handling with logging"""
+        # Always shown - validation failures are never silent, with or without --debug
         print(f"   ❌ {message}")
         self._log_function_call("update_data", 
                                {"field": field, "value": value}, 
@@ -66,10 +149,9 @@ class DataManager:
             self.session.stage_manager.on_function_call(function_name, args, result)
     
     def _load_widget_config(self):
-        """Load widget configuration (hidden from LLM)"""
+        """Load widget configuration (hidden from LLM) - parsed once per process, shared read-only"""
         try:
-            with open(self.widget_config_file, 'r') as f:
-                return json.load(f)
+            return load_json(self.widget_config_file)
         except FileNotFoundError:
             return {"widget_fields": {}}
         except Exception as e:
@@ -120,35 +202,81 @@ class DataManager:
         return result
         
     def load_data(self):
-        """Load data from JSON file"""
-        with open(self.data_file, 'r') as f:
-            return json.load(f)
+        """Load data - read from disk on first use, then served from memory"""
+        # Every change goes through update_data/save_data, so memory is never older than the file
+        if self._data is None:
+            with open(self.data_file, 'rb') as f:
+                self._data = orjson.loads(f.read())
+            self._derived_cache.clear()
+        return self._data
     
-    def save_data(self, data):
-        """Save data to JSON file"""
-        with open(self.data_file, 'w') as f:
-            json.dump(data, f, indent=2)
-        
-    def get_data_status(self) -> str:
-        """Get current data status with detailed human-readable format"""
+    def snapshot(self):
+        """Copy of the current data - shared by every caller until the data changes, so treat it as read-only"""
         data = self.load_data()
-        
-        # Separate filled and missing data
-        filled = {key: value for key, value in data.items() if value is not None}
-        missing = [key for key, value in data.items() if value is None]
-        
-        # Build status sections
-        recorded_section = [
+        if 'snapshot' not in self._derived_cache:
+            self._derived_cache['snapshot'] = data.copy()
+        return self._derived_cache['snapshot']
+    
+    async def save_data(self, data):
+        """Save data to JSON file off the event loop and keep the in-memory copy in sync"""
+        async with self._save_lock:
+            self._data = data
+            self._derived_cache.clear()
+            payload = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+            await asyncio.to_thread(self._write_data_file, payload)
+    
+    async def flush(self):
+        """Write pending update_data changes - one write per turn however many fields changed"""
+        if not self._dirty:
+            return
+        self._dirty = False
+        await self.save_data(self._data)
+    
+    @asynccontextmanager
+    async def buffered(self):
+        """Batch every update_data inside the block into one write on exit - even if the block raises"""
+        try:
+            yield self
+        finally:
+            await self.flush()
+    
+    def _write_data_file(self, payload):
+        """Blocking atomic write (runs in a worker thread) - a crash never leaves a partial data.json"""
+        _atomic_write(self.data_file, payload)
+        
+    def _build_data_sections(self, data):
+        """Build RECORDED/MISSING sections shared by both status reports"""
+        # Single pass over data - filled lines, missing field names and missing lines together
+        filled, missing, missing_lines = [], [], []
+        for key, value in data.items():
+            filled_template, missing_line = _field_templates(key)
+            if value is None:
+                missing.append(key)
+                missing_lines.append(missing_line)
+            else:
+                filled.append(filled_template.format(value))
+        
+        sections = [
             "=== RECORDED USER DATA ===",
-            "• No data recorded yet" if not filled else 
-            "\n".join([f"- {field.capitalize()}: {value}" for field, value in filled.items()])
-        ]
-        
-        missing_section = [
+            "• No data recorded yet" if not filled else "\n".join(filled),
             "\n=== MISSING FIELDS ===",
-            "• All fields complete!" if not missing else 
-            "\n".join([f"• {field.capitalize()}: null" for field in missing])
+            "• All fields complete!" if not missing else "\n".join(missing_lines)
         ]
+        return missing, sections
+        
+    def get_data_status(self, data=None) -> str:
+        """Get current data status with detailed human-readable format - memoized until data changes
+        
+        Args:
+            data (dict, optional): Already-loaded data, saves a second load_data() when the caller has it
+        """
+        if data is None:
+            data = self.load_data()
+        # Memo only describes the managed data, not an arbitrary snapshot
+        memoize = data is self._data
+        if memoize and 'status' in self._derived_cache:
+            return self._derived_cache['status']
+        missing, data_sections = self._build_data_sections(data)
         
         next_action = [
             "\n=== PLANNER GUIDANCE ===",
@@ -156,28 +284,27 @@ class DataManager:
             "• STATUS: All data collected, ready for recommendations"
         ]
         
-        return "\n".join(recorded_section + missing_section + next_action)
+        status = "\n".join(data_sections + next_action)
+        if memoize:
+            self._derived_cache['status'] = status
+        return status
     
     @kernel_function(
         name="update_data",
         description="Saves the user's answer to a specific field. After saving, this function's return message will EXPLICITLY tell you what to do next: either call ask_question for the next empty field or confirm that the process is complete. You must follow this instruction."
     )
-    def update_data(
+    async def update_data(
         self,
         field: str,
         value: str
     ) -> str:
         data = self.load_data()
         
-        # Find actual field name (case-insensitive)
-        actual_field = None
-        for key in data.keys():
-            if key.lower() == field.lower():
-                actual_field = key
-                break
+        # Field names in data.json are lowercase - normalize once (case-insensitive lookup)
+        actual_field = field.lower()
         
         # Validation with unified error handling
-        if actual_field is None:
+        if actual_field not in data:
             return self._handle_error("field_not_found", field, value,
                                     f"Error: Field '{field}' not found. Available fields: {list(data.keys())}")
         
@@ -185,43 +312,33 @@ class DataManager:
             return self._handle_error("empty_value", field, value,
                                     f"Cannot update {actual_field} with empty value. Only update when you have actual user-provided information.")
         
-        if data[actual_field] is not None and str(data[actual_field]) == str(value):
+        # Type conversion for numeric fields - single table lookup
+        converter = _FIELD_CONVERTERS.get(actual_field)
+        if converter is None:
+            # All other fields (widget-based) remain as strings
+            new_value = value
+        else:
+            convert, expected_format = converter
+            new_value = convert(value)
+            if new_value is None:
+                return self._handle_error("type_conversion", field, value,
+                                        f"Error: {actual_field} must be {expected_format}, got '{value}' ")
+        
+        # Compare converted values so "70" vs 70.0 is caught - no write for a no-op update
+        if data[actual_field] == new_value:
             return self._handle_error("duplicate_value", field, value,
                                     f"Field {actual_field} already has value '{data[actual_field]}'. No update needed unless user provides new information.")
         
-        # Type conversion for numeric fields
-        if actual_field == "age":
-            try:
-                data[actual_field] = int(value)
-            except ValueError:
-                return self._handle_error("type_conversion", field, value,
-                                        f"Error: {actual_field} must be a whole number, got '{value}' ")
-        elif actual_field == "height":
-            try:
-                # Handle height as float (removing any units like 'cm')
-                clean_value = value.replace('cm', '').replace('centimeter', '').strip()
-                data[actual_field] = float(clean_value)
-            except ValueError:
-                return self._handle_error("type_conversion", field, value,
-                                        f"Error: {actual_field} must be a number in centimeters, got '{value}' ")
-        elif actual_field == "weight":
-            try:
-                # Handle weight as float (removing any units like 'kg')
-                clean_value = value.replace('kg', '').replace('kilo', '').strip()
-                data[actual_field] = float(clean_value)
-            except ValueError:
-                return self._handle_error("type_conversion", field, value,
-                                        f"Error: {actual_field} must be a number in kilograms, got '{value}' ")
-        else:
-            # All other fields (widget-based) remain as strings
-            data[actual_field] = value
-        
         # Success path
-        self.save_data(data)
+        # Mutate in memory only - written once by flush() at the end of the turn
+        data[actual_field] = new_value
+        self._dirty = True
+        self._derived_cache.clear()
         result = f"Updated {actual_field} to {data[actual_field]}"
         
+        # Snapshot, not the live dict - later updates mutate data in place
         self._log_function_call("update_data", 
-                               {"field": field, "value": value, "current_data": data}, 
+                               {"field": field, "value": value, "current_data": self.snapshot()}, 
                                {"result": result, "actual_field": actual_field, "new_value": data[actual_field]}, 
                                {"success": True})
         
@@ -238,9 +355,6 @@ class DataManager:
         field: str,
         message: str
     ) -> str:
-        # Convert InputVariable to string if needed
-        field = str(field) if hasattr(field, '__str__') else field
-        message = str(message) if hasattr(message, '__str__') else message 
         data = self.load_data()
         
         # Simple field validation (normalize to lowercase for comparison)
@@ -294,9 +408,8 @@ class DataManager:
         return "Obese"
     
     def _load_actions_data(self):
-        """Load actions.json for recommendations - fail fast if missing"""
-        with open("data/actions.json", 'r') as f:
-            return json.load(f)
+        """Load actions.json for recommendations - fail fast if missing (parsed once per process, read-only)"""
+        return load_json("data/actions.json")
     
     def _get_relevant_actions(self, data):
         """Process actions.json and return relevant recommendations based on current data"""
@@ -416,26 +529,18 @@ class DataManager:
             "applicable_specialists": applicable_specialists
         }
     
-    def get_data_status_with_insights(self) -> str:
-        """Enhanced data status with BMI and health insights for PLANNER AGENT"""
-        data = self.load_data()
-        
-        # Get basic data status sections
-        filled = {key: value for key, value in data.items() if value is not None}
-        missing = [key for key, value in data.items() if value is None]
-        
-        # Build enhanced sections
-        recorded_section = [
-            "=== RECORDED USER DATA ===",
-            "• No data recorded yet" if not filled else 
-            "\n".join([f"- {field.capitalize()}: {value}" for field, value in filled.items()])
-        ]
-        
-        missing_section = [
-            "\n=== MISSING FIELDS ===",
-            "• All fields complete!" if not missing else 
-            "\n".join([f"• {field.capitalize()}: null" for field in missing])
-        ]
+    def get_data_status_with_insights(self, data=None) -> str:
+        """Enhanced data status with BMI and health insights for PLANNER AGENT - memoized until data changes
+        
+        Args:
+            data (dict, optional): Already-loaded data, saves a second load_data() when the caller has it
+        """
+        if data is None:
+            data = self.load_data()
+        memoize = data is self._data
+        if memoize and 'insights' in self._derived_cache:
+            return self._derived_cache['insights']
+        missing, data_sections = self._build_data_sections(data)
         
         # Add health insights section
         insights = self._get_relevant_actions(data)
@@ -451,25 +556,20 @@ class DataManager:
             "• NEXT ACTION: Provide personalized recommendations - call provide_recommendations()"
         ]
         
-        return "\n".join(recorded_section + missing_section + health_section + next_action)
+        status = "\n".join(data_sections + health_section + next_action)
+        if memoize:
+            self._derived_cache['insights'] = status
+        return status
     
-    @kernel_function(
-        name="provide_recommendations",
-        description="Provide final health recommendations and complete the planning session. Use this when you have sufficient data to give personalized health advice and want to end the data collection phase."
-    )
     def _parse_recommendations(self, recommendations_text):
         """Parse structured recommendation format - simple regex approach"""
-        import re
-        from datetime import datetime
-        
         # Split into recommendation part and Nora instructions
         parts = recommendations_text.split("</FINAL_RECOMMENDATION>")
         recommendation_xml = parts[0] + "</FINAL_RECOMMENDATION>"
         nora_instructions = parts[1].strip() if len(parts) > 1 else ""
         
-        # Parse each priority level - simple regex patterns
-        priority_pattern = r'<(\w+_priority)>\s*<explanation>(.*?)</explanation>\s*<action_list>\[(.*?)\]</action_list>\s*</\w+_priority>'
-        matches = re.findall(priority_pattern, recommendation_xml, re.DOTALL)
+        # Parse each priority level - simple regex pattern (compiled once at module level)
+        matches = _PRIORITY_RE.findall(recommendation_xml)
         
         parsed_recommendations = {}
         for priority_level, explanation, actions in matches:
@@ -482,10 +582,8 @@ class DataManager:
         
         return parsed_recommendations, nora_instructions.replace("Nora,", "").strip()
     
-    def _save_recommendations(self, parsed_recs, nora_instructions, user_data, insights):
-        """Save structured recommendations to data/recommendations.json"""
-        from datetime import datetime
-        
+    async def _save_recommendations(self, parsed_recs, nora_instructions, user_data, insights):
+        """Save structured recommendations to data/recommendations.json off the event loop"""
         # Build comprehensive recommendation record
         recommendation_record = {
             "metadata": {
@@ -526,11 +624,15 @@ class DataManager:
         }
         
         # Save to recommendations.json - fail fast if directory issue
-        with open("data/recommendations.json", 'w') as f:
-            json.dump(recommendation_record, f, indent=2)
+        payload = orjson.dumps(recommendation_record, option=orjson.OPT_INDENT_2)
+        await asyncio.to_thread(self._write_recommendations_file, payload)
         
         return recommendation_record
     
+    def _write_recommendations_file(self, payload):
+        """Blocking atomic write (runs in a worker thread) - concurrent test agents share this file"""
+        _atomic_write("data/recommendations.json", payload)
+    
     def _identify_risk_factors(self, user_data):
         """Identify key risk factors for justification"""
         risk_factors = []
@@ -572,7 +674,7 @@ class DataManager:
         name="provide_recommendations",
         description="Provide final health recommendations and complete the planning session. Use this when you have sufficient data to give personalized health advice and want to end the data collection phase."
     )
-    def provide_recommendations(
+    async def provide_recommendations(
         self,
         recommendations: str
     ) -> str:
@@ -584,12 +686,12 @@ class DataManager:
         parsed_recs, nora_instructions = self._parse_recommendations(recommendations)
         
         # Save structured recommendations to file
-        recommendation_record = self._save_recommendations(parsed_recs, nora_instructions, data, insights)
+        recommendation_record = await self._save_recommendations(parsed_recs, nora_instructions, data, insights)
         
         result = f"[RECOMMENDATIONS PROVIDED] Planning session complete.\n\nUser recommendations:\n{recommendations}\n\nAvailable actions: {len(insights['applicable_reminders'])} reminders, {len(insights['applicable_specialists'])} specialists\n\n💾 Recommendations saved to: data/recommendations.json"
         
         self._log_function_call("provide_recommendations",
-                               {"recommendations": recommendations, "user_data": data},
+                               {"recommendations": recommendations, "user_data": self.snapshot()},
                                {"result": result, "available_actions": insights, "saved_file": "data/recommendations.json"},
                                {"success": True, "session_complete": True})
         
@@ -1,9 +1,7 @@
 import json
-import random
 import sys
-from datetime import datetime
 from typing import Optional, Dict, List
-from semantic_kernel.functions import kernel_function
+from ui.chat_ui import print_widget_box
 
 # Test mode detection - can be overridden for Jupyter usage
 # For Jupyter: import ui.widget_handler; ui.widget_handler.TEST_MODE = True
@@ -64,8 +62,6 @@ class WidgetHandler:
     
     def show_widget_interface(self, question: Dict, test_value: Optional[str] = None) -> Optional[str]:
         """Show widget interface and get user selection"""
-        from ui.chat_ui import print_widget_box
-        
         question_text = question['question_text']
         
         # Handle different question formats
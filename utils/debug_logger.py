@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Debug Logger - Consistent debug output across modules
+Only enabled with --debug; disabled calls skip formatting and stdout writes
+"""
+
+import logging
+import sys
+
+# Check for debug mode
+DEBUG_MODE = "--debug" in sys.argv
+
+# Own stdout handler - telemetry routes root logging to a file in debug mode,
+# so debug output must not propagate there
+_debug_root = logging.getLogger("debug")
+_debug_root.propagate = False
+_handler = logging.StreamHandler(sys.stdout)
+_handler.setFormatter(logging.Formatter("%(message)s"))
+_debug_root.addHandler(_handler)
+_debug_root.setLevel(logging.DEBUG if DEBUG_MODE else logging.WARNING)
+
+
+def get_debug_logger(source):
+    """
+    Get the debug logger for a module
+
+    Args:
+        source (str): Short module name (e.g. "data_manager")
+
+    Returns:
+        logging.Logger: Use %-style args - log.debug("Updated %s", field)
+    """
+    return _debug_root.getChild(source)
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+File Loader Utility - Shared loading for static prompt/template and JSON config files
+Each file is read once per process; call load_text/load_json.cache_clear() to re-read
+"""
+
+from functools import lru_cache
+
+import orjson
+
+
+@lru_cache(maxsize=None)
+def load_text(path):
+    """
+    Load a static text file - fail fast if missing
+
+    Args:
+        path (str): File path relative to the project root
+
+    Returns:
+        str: File contents (cached for the process lifetime)
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+@lru_cache(maxsize=None)
+def load_json(path):
+    """
+    Load a static JSON file - fail fast if missing or invalid
+
+    Args:
+        path (str): File path relative to the project root
+
+    Returns:
+        Parsed JSON (cached and shared for the process lifetime - do not mutate)
+    """
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+"""
+Hash utilities for short, log-friendly content ids
+"""
+
+import hashlib
+
+
+def short_hash(text):
+    """
+    Short content hash for telemetry/debug output - not for security
+
+    Args:
+        text (str): Text to identify (e.g. a rendered prompt)
+
+    Returns:
+        str: 8 hex characters (BLAKE2b with a 4-byte digest)
+    """
+    return hashlib.blake2b(text.encode(), digest_size=4).hexdigest()
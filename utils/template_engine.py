@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Template Engine - Shared {{PLACEHOLDER}} rendering for prompt templates
+Templates are split into literal/placeholder parts once; each render is a single join
+"""
+
+import re
+from functools import lru_cache
+
+_PLACEHOLDER_RE = re.compile(r"\{\{([A-Z_]+)\}\}")
+
+
+@lru_cache(maxsize=None)
+def _compile(template):
+    """Split template into alternating literal text and placeholder names (odd indexes)"""
+    return tuple(_PLACEHOLDER_RE.split(template))
+
+
+def replace_placeholders(template, **values):
+    """
+    Render a template in one pass
+
+    Args:
+        template (str): Text with {{NAME}} placeholders
+        **values: Replacement per placeholder name - unknown placeholders are left as-is
+
+    Returns:
+        str: Rendered text (substituted values are never re-scanned for placeholders)
+    """
+    parts = list(_compile(template))
+    for i in range(1, len(parts), 2):
+        name = parts[i]
+        parts[i] = str(values[name]) if name in values else f"{{{{{name}}}}}"
+    return "".join(parts)